@@ -0,0 +1,135 @@
+import argparse
+import json
+import os
+import struct
+import sys
+import time
+import numpy as np
+
+from cnn_runner_final import Ultra96CNNRunner, Ultra96MQTTSubscriber, NumpyCNNBackend
+
+
+# Stage-level micro-benchmarks for cnn_runner_final.py. Inputs come from the
+# shipped artifacts (meta.json, pca_params_summarizer.npz, HLS_PARAMS/tb_vector.h)
+# and the DMA is replaced by the NumPy CPU backend. Results are median
+# microseconds per call; with a stored baseline the run fails when a stage
+# is slower than baseline * (1 + tolerance).
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_baseline.json")
+
+
+def measure(fn, number, repeat):
+    runs = []
+    for _ in range(repeat):
+        t0 = time.perf_counter_ns()
+        for _ in range(number):
+            fn()
+        runs.append((time.perf_counter_ns() - t0) / number / 1000.0)
+    return float(np.median(runs))
+
+
+def make_packet(rng):
+    vals = rng.standard_normal((4 * 5, 6)).astype(np.float32) * 10
+    return b"".join(struct.pack("!6f", *v) for v in vals)
+
+
+def run_benchmarks(artifacts, number, repeat):
+    backend = NumpyCNNBackend.from_hls_params(os.path.join(artifacts, "HLS_PARAMS"))
+    ai = Ultra96CNNRunner(
+        meta_path=os.path.join(artifacts, "meta.json"),
+        pca_npz=os.path.join(artifacts, "pca_params_summarizer.npz"),
+        backend=backend,
+    )
+    tb_in = NumpyCNNBackend._read_header_array(os.path.join(artifacts, "HLS_PARAMS", "tb_vector.h"), "TB_TEST_IN")
+    logits = backend.infer(tb_in[None, :])[0]
+
+    rng = np.random.default_rng(0)
+    raw = make_packet(rng)
+    readings, _ = Ultra96MQTTSubscriber.parse_packet_exact_4_frames(raw)
+    row = Ultra96CNNRunner.readings_to_row(readings[0])
+    for _ in range(ai.WINDOW):
+        ai.push_row(rng.standard_normal(30).astype(np.float32))
+    win = ai._buf.view()
+    seg = ai._summarize_window(win)
+    flat = seg.reshape(-1)
+    packet_rows, _ = Ultra96MQTTSubscriber.decode_packet(raw)
+
+    stages = {
+        "parse_packet_exact_4_frames": lambda: Ultra96MQTTSubscriber.parse_packet_exact_4_frames(raw),
+        "decode_packet": lambda: Ultra96MQTTSubscriber.decode_packet(raw),
+        "readings_to_row": lambda: Ultra96CNNRunner.readings_to_row(readings[0]),
+        "push_row": lambda: ai.push_row(row),
+        "_summarize_window": lambda: ai._summarize_window(win),
+        "incremental_summary": lambda: ai._summ.summary(),
+        "_apply_scaler_pca": lambda: ai._apply_scaler_pca(flat),
+        "projection_plan": lambda: ai._plan.project(flat),
+        "cpu_backend_run": lambda: backend.run(1),
+        "_softmax": lambda: Ultra96CNNRunner._softmax(logits),
+        "postprocess": lambda: ai._postprocess(logits, ai.stream_time()),
+        "infer_once": ai.infer_once,
+        "infer_batch_packet": lambda: ai.infer_batch(packet_rows),
+    }
+
+    results = {}
+    for name, fn in stages.items():
+        fn()
+        results[name] = measure(fn, number, repeat)
+        print(f"{name:30s} {results[name]:10.2f} us")
+    ai.close()
+    return results
+
+
+def compare(results, baseline, tolerance):
+    failed = []
+    for name, base in baseline.items():
+        if name not in results:
+            continue
+        limit = base * (1.0 + tolerance)
+        status = "ok"
+        if results[name] > limit:
+            status = "REGRESSED"
+            failed.append(name)
+        print(f"{name:30s} {results[name]:10.2f} us  baseline={base:10.2f} us  "
+              f"({(results[name] / base - 1) * 100:+6.1f}%)  {status}")
+    return failed
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--artifacts", default="artifacts_tf", help="directory with meta.json, npz and HLS_PARAMS")
+    ap.add_argument("--number", type=int, default=200, help="calls per repeat")
+    ap.add_argument("--repeat", type=int, default=7)
+    ap.add_argument("--baseline", default=BASELINE)
+    ap.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown vs baseline (0.25 = 25%%)")
+    ap.add_argument("--save-baseline", action="store_true", help="store this run as the new baseline")
+    ap.add_argument("--json", default=None, help="write results to this file")
+    args = ap.parse_args()
+
+    results = run_benchmarks(args.artifacts, args.number, args.repeat)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"unit": "us_per_call", "results": results}, f, indent=2)
+        print("Saved:", args.json)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print("Baseline saved:", args.baseline)
+        return
+
+    if not os.path.exists(args.baseline):
+        print("No baseline at", args.baseline, "- run with --save-baseline on the target machine.")
+        return
+
+    with open(args.baseline, "r") as f:
+        baseline = json.load(f)
+    print()
+    failed = compare(results, baseline, args.tolerance)
+    if failed:
+        print("\nRegressed stages:", ", ".join(failed))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+import argparse
+import glob
+import json
+import os
+import numpy as np
+
+from cnn_runner_final import (
+    IncrementalSummarizer, ProjectionPlan, NumpyCNNBackend, MotionGate, Ultra96CNNRunner,
+)
+
+
+# Calibrates the MotionGate threshold on recorded ultra96_csv_logger sessions.
+# Every window is scored with the ungated CPU model; windows the model calls
+# non-zero (after the 0.5 confidence threshold) count as positives, and recall
+# is the share of those positives the gate would still let through.
+
+def load_csv_rows(path):
+    return np.loadtxt(path, delimiter=",", skiprows=1, usecols=range(1, 31), dtype=np.float32)
+
+
+def score_session(rows, summ, plan, backend, gate):
+    summ.reset()
+    scores, segs = [], []
+    for row in rows:
+        summ.push(row)
+        if summ.ready():
+            scores.append(gate.score(summ))
+            segs.append(summ.summary())
+    if not segs:
+        return np.zeros(0), np.zeros(0, dtype=int)
+
+    logits = backend.infer(plan.project_batch(np.stack(segs)))
+    probs = np.stack([Ultra96CNNRunner._softmax(l) for l in logits])
+    raw = probs.argmax(axis=1)
+    raw[(raw != 0) & (probs.max(axis=1) < 0.5)] = 0
+    return np.asarray(scores), raw
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--artifacts", default="artifacts_tf", help="directory with meta.json, npz and HLS_PARAMS")
+    ap.add_argument("--data", default="raw_data_from_ultra96", help="directory of recorded CSVs")
+    ap.add_argument("--recall", type=float, default=0.99, help="minimum share of positives kept")
+    ap.add_argument("--segments", type=int, default=None,
+                    help="newest segments the gate looks at (default: whole window)")
+    ap.add_argument("--out", default=None, help="write the chosen threshold to this JSON file")
+    args = ap.parse_args()
+
+    with open(os.path.join(args.artifacts, "meta.json"), "r") as f:
+        meta = json.load(f)
+    summ = IncrementalSummarizer(int(meta["window"]), int(meta["num_segments"]), meta["stats_list"], 30)
+    plan = ProjectionPlan.load(os.path.join(args.artifacts, "pca_params_summarizer.npz"), args.artifacts)
+    backend = NumpyCNNBackend.from_hls_params(os.path.join(args.artifacts, "HLS_PARAMS"))
+    gate = MotionGate(0.0, args.segments or int(meta["num_segments"]))
+
+    all_scores, all_raw = [], []
+    for path in sorted(glob.glob(os.path.join(args.data, "*.csv"))):
+        scores, raw = score_session(load_csv_rows(path), summ, plan, backend, gate)
+        all_scores.append(scores)
+        all_raw.append(raw)
+        print(f"{os.path.basename(path):28s} windows={len(raw):6d}  positives={int((raw != 0).sum()):5d}  "
+              f"median_score={np.median(scores) if len(scores) else 0:.3f}")
+
+    scores = np.concatenate(all_scores)
+    pos = np.concatenate(all_raw) != 0
+    if not pos.any():
+        print("No positive windows found, cannot calibrate.")
+        return
+
+    print(f"\n{'threshold':>10s} {'hit_rate':>9s} {'recall':>8s}")
+    best = 0.0
+    for thr in np.unique(np.quantile(scores, np.linspace(0.0, 0.95, 40))):
+        hit_rate = float((scores < thr).mean())
+        recall = float(1.0 - (scores[pos] < thr).mean())
+        print(f"{thr:10.3f} {hit_rate * 100:8.1f}% {recall * 100:7.2f}%")
+        if recall >= args.recall:
+            best = max(best, float(thr))
+
+    hit_rate = float((scores < best).mean())
+    recall = float(1.0 - (scores[pos] < best).mean())
+    print(f"\nChosen threshold={best:.3f}  hit_rate={hit_rate * 100:.1f}%  recall={recall * 100:.2f}%")
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump({"threshold": best, "hit_rate": hit_rate, "recall": recall,
+                       "segments": gate.segments, "channels": gate.channels}, f, indent=2)
+        print("Saved:", args.out)
+
+
+if __name__ == "__main__":
+    main()
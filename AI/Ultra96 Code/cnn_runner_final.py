@@ -4,24 +4,385 @@ import time
 import struct
 from datetime import datetime
 import ssl
+import os
+import hashlib
+import re
 import numpy as np
 from collections import deque
-from queue import Queue, Empty
-from threading import Thread
+from queue import Queue, Empty, Full
+from threading import Thread, Lock, Event, get_ident
+from contextlib import contextmanager
 from typing import Optional
-from pynq import Overlay, allocate
 
 
-# Ultra96 Hardware CNN Runner
-class Ultra96CNNRunner:
-    def __init__(
-        self,
-        bitfile="cnn_overlay_11.xsa",
-        meta_path="artifacts_tf/meta.json",
-        pca_npz="artifacts_tf/pca_params_summarizer.npz",
-        cnn_ip_name="cnn1d_ip_0",
-        dma_name="axi_dma_0",
-    ):
+# Opt-in per-stage profiler. Spans are perf_counter_ns pairs; each stage keeps
+# a fixed-size log2(ns) histogram plus count/sum/max, and optionally the last
+# `max_events` spans for a Chrome trace (chrome://tracing, Perfetto).
+class StageProfiler:
+    BUCKETS = 40
+
+    def __init__(self, trace_path=None, max_events=200000):
+        self.trace_path = trace_path
+        self._hist = {}
+        self._lock = Lock()
+        self._t0 = time.perf_counter_ns()
+        self._events = deque(maxlen=max_events) if trace_path else None
+
+    def span(self, stage, t0_ns, t1_ns):
+        dur = t1_ns - t0_ns
+        with self._lock:
+            h = self._hist.get(stage)
+            if h is None:
+                h = self._hist[stage] = [np.zeros(self.BUCKETS, dtype=np.int64), 0, 0, 0]
+            h[0][min(dur.bit_length(), self.BUCKETS - 1)] += 1
+            h[1] += 1
+            h[2] += dur
+            h[3] = max(h[3], dur)
+            if self._events is not None:
+                self._events.append((stage, t0_ns, dur, get_ident()))
+
+    # Upper bound of the histogram bucket holding quantile q, in microseconds,
+    # clamped to the largest span seen
+    @staticmethod
+    def _quantile_us(counts, q, max_ns):
+        target = q * counts.sum()
+        idx = int(np.searchsorted(np.cumsum(counts), target))
+        return min(1 << idx, max_ns) / 1000.0
+
+    def summary(self):
+        out = {}
+        with self._lock:
+            for stage, (counts, n, total, mx) in self._hist.items():
+                out[stage] = {
+                    "count": n,
+                    "mean_us": total / n / 1000.0,
+                    "p50_us": self._quantile_us(counts, 0.50, mx),
+                    "p99_us": self._quantile_us(counts, 0.99, mx),
+                    "max_us": mx / 1000.0,
+                }
+        return out
+
+    def report(self):
+        lines = ["[PROF] stage                 count    mean_us   p50<=us   p99<=us    max_us"]
+        for stage, r in self.summary().items():
+            lines.append(f"[PROF] {stage:20s} {r['count']:7d} {r['mean_us']:10.1f} {r['p50_us']:9.1f} "
+                         f"{r['p99_us']:9.1f} {r['max_us']:9.1f}")
+        return "\n".join(lines)
+
+    def write_trace(self, path=None):
+        path = path or self.trace_path
+        if not path or self._events is None:
+            return
+        with self._lock:
+            events = [{"name": stage, "ph": "X", "pid": 1, "tid": tid,
+                       "ts": (t0 - self._t0) / 1000.0, "dur": dur / 1000.0}
+                      for stage, t0, dur, tid in self._events]
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+        print("[PROF] Trace written:", path)
+
+
+# Startup phase timings (overlay, artifacts, broker connect, ...) and one-off
+# events (ready, first window, first gesture), in seconds since creation.
+# Phases may overlap: they run in parallel during fast start.
+class StartupTimer:
+    def __init__(self):
+        self._t0 = time.perf_counter()
+        self.phases = {}
+        self.events = {}
+        self._lock = Lock()
+
+    def now(self):
+        return time.perf_counter() - self._t0
+
+    @contextmanager
+    def phase(self, name):
+        start = self.now()
+        try:
+            yield
+        finally:
+            self.end(name, start)
+
+    def end(self, name, start):
+        with self._lock:
+            self.phases[name] = (start, self.now())
+
+    # Records the first occurrence only; True when this call recorded it
+    def mark(self, name):
+        with self._lock:
+            if name in self.events:
+                return False
+            self.events[name] = self.now()
+            return True
+
+    def summary(self):
+        with self._lock:
+            return {
+                "phases": {k: {"start_s": round(a, 3), "end_s": round(b, 3)} for k, (a, b) in self.phases.items()},
+                "events": {k: round(v, 3) for k, v in self.events.items()},
+            }
+
+    def report(self):
+        with self._lock:
+            phases = "  ".join(f"{k} {a:.2f}-{b:.2f}s" for k, (a, b) in self.phases.items())
+            events = "  ".join(f"{k}@{v:.2f}s" for k, v in self.events.items())
+        return f"[START] {phases}  |  {events}"
+
+
+# Sliding sum / sum-of-squares / max / min over the newest `length` rows.
+# Rows are kept in blocks of `length`: prefix stats of the current block plus
+# suffix stats of the previous block cover any window of `length` rows, so each
+# push costs O(1) vector ops (one cumulative pass per completed block).
+class _SlidingStats:
+    def __init__(self, length, channels):
+        self.length = length
+        self._block = np.zeros((length, channels), dtype=np.float64)
+        self._k = 0
+        self._pre = np.zeros((4, channels), dtype=np.float64)
+        self._suf = np.zeros((length, 4, channels), dtype=np.float64)
+        self._has_prev = False
+        self._sq = np.zeros(channels, dtype=np.float64)
+
+    def reset(self):
+        self._k = 0
+        self._has_prev = False
+
+    def push(self, row):
+        if self._k == self.length:
+            rev = self._block[::-1]
+            self._suf[:, 0] = np.cumsum(rev, axis=0)[::-1]
+            self._suf[:, 1] = np.cumsum(rev * rev, axis=0)[::-1]
+            self._suf[:, 2] = np.maximum.accumulate(rev, axis=0)[::-1]
+            self._suf[:, 3] = np.minimum.accumulate(rev, axis=0)[::-1]
+            self._has_prev = True
+            self._k = 0
+
+        x = self._block[self._k]
+        x[:] = row
+        pre = self._pre
+        if self._k == 0:
+            pre[0] = x
+            np.multiply(x, x, out=pre[1])
+            pre[2] = x
+            pre[3] = x
+        else:
+            pre[0] += x
+            np.multiply(x, x, out=self._sq)
+            pre[1] += self._sq
+            np.maximum(pre[2], x, out=pre[2])
+            np.minimum(pre[3], x, out=pre[3])
+        self._k += 1
+
+    # Stats of the newest `length` rows written into out[4, channels]
+    def current(self, out):
+        out[:] = self._pre
+        if self._k < self.length and self._has_prev:
+            suf = self._suf[self._k]
+            out[0] += suf[0]
+            out[1] += suf[1]
+            np.maximum(out[2], suf[2], out=out[2])
+            np.minimum(out[3], suf[3], out=out[3])
+
+
+# Incremental equivalent of Ultra96CNNRunner._summarize_window.
+# Segment s of the window is the sliding window of its length that ended
+# (WINDOW - b_s) rows ago, so per-row sliding stats are kept in a history ring
+# and the summary only gathers NUM_SEGMENTS entries from it.
+class IncrementalSummarizer:
+    def __init__(self, window, num_segments, stats_list, channels):
+        self.window = window
+        self.stats_list = list(stats_list)
+        bounds = [round(s * window / num_segments) for s in range(num_segments + 1)]
+        self._seg_len = [bounds[s + 1] - bounds[s] for s in range(num_segments)]
+        self._seg_lag = [window - bounds[s + 1] for s in range(num_segments)]
+
+        self._stats = {L: _SlidingStats(L, channels) for L in set(self._seg_len)}
+        self._hist = {L: np.zeros((window, 4, channels), dtype=np.float64) for L in self._stats}
+        self._gather = np.zeros((num_segments, 4, channels), dtype=np.float64)
+        self._lens = np.array(self._seg_len, dtype=np.float64)[:, None]
+        self._n = 0
+
+    def reset(self):
+        for st in self._stats.values():
+            st.reset()
+        self._n = 0
+
+    def ready(self):
+        return self._n >= self.window
+
+    def push(self, row):
+        slot = self._n % self.window
+        for L, st in self._stats.items():
+            st.push(row)
+            st.current(self._hist[L][slot])
+        self._n += 1
+
+    # Per-channel std of the newest `count` segments, shape (count, channels)
+    def newest_std(self, count=1):
+        newest = self._n - 1
+        out = np.empty((count, self._gather.shape[2]), dtype=np.float64)
+        for j, s in enumerate(range(len(self._seg_len) - count, len(self._seg_len))):
+            L = self._seg_len[s]
+            st = self._hist[L][(newest - self._seg_lag[s]) % self.window]
+            mean = st[0] / L
+            out[j] = np.sqrt(np.maximum(st[1] / L - mean * mean, 0.0))
+        return out
+
+    def summary(self):
+        newest = self._n - 1
+        for s, (L, lag) in enumerate(zip(self._seg_len, self._seg_lag)):
+            self._gather[s] = self._hist[L][(newest - lag) % self.window]
+
+        total, sq, mx, mn = (self._gather[:, i] for i in range(4))
+        mean = total / self._lens
+        parts = []
+        if "mean" in self.stats_list:   parts.append(mean)
+        if "std" in self.stats_list:    parts.append(np.sqrt(np.maximum(sq / self._lens - mean * mean, 0.0)) + 1e-8)
+        if "p2p" in self.stats_list:    parts.append(mx - mn)
+        if "energy" in self.stats_list: parts.append(sq)
+        return np.concatenate(parts, axis=1).astype(np.float32)
+
+
+# Preallocated sliding window. Each row is written at slot and slot+WINDOW, so
+# the current window is always the contiguous, zero-copy view [n % W, n % W + W).
+class WindowRing:
+    def __init__(self, window, channels):
+        self.window = window
+        self._data = np.zeros((2 * window, channels), dtype=np.float32)
+        self._n = 0
+
+    def __len__(self):
+        return min(self._n, self.window)
+
+    # Total rows pushed since reset
+    @property
+    def count(self):
+        return self._n
+
+    def reset(self):
+        self._n = 0
+
+    def push(self, row):
+        slot = self._n % self.window
+        dst = self._data[slot]
+        dst[:] = row
+        self._data[slot + self.window] = dst
+        self._n += 1
+        return dst
+
+    def latest(self):
+        return self._data[(self._n - 1) % self.window]
+
+    def view(self):
+        start = self._n % self.window
+        return self._data[start:start + self.window]
+
+
+# Scaler + PCA folded at load time into one float32 affine map: y = x @ W + b.
+# The folded plan is cached next to meta.json, keyed on the npz contents.
+class ProjectionPlan:
+    CACHE_NAME = "pca_plan_compiled.npz"
+
+    def __init__(self, W, b, source_key=""):
+        self.W = np.ascontiguousarray(W, dtype=np.float32)
+        self.b = np.ascontiguousarray(b, dtype=np.float32)
+        self.source_key = source_key
+
+    @classmethod
+    def fold(cls, scaler_mean, scaler_scale, pca_components, pca_mean, source_key=""):
+        scale = scaler_scale.astype(np.float64)
+        comp = pca_components.astype(np.float64)
+        W = (comp / scale[None, :]).T
+        b = -(scaler_mean.astype(np.float64) / scale + pca_mean.astype(np.float64)).dot(comp.T)
+        return cls(W, b, source_key)
+
+    @classmethod
+    def load(cls, pca_npz, cache_dir):
+        with open(pca_npz, "rb") as f:
+            key = hashlib.sha1(f.read()).hexdigest()
+        cache_path = os.path.join(cache_dir, cls.CACHE_NAME)
+
+        try:
+            cached = np.load(cache_path)
+            if str(cached["source_key"]) == key:
+                print("[AI] Projection plan loaded from cache:", cache_path)
+                return cls(cached["W"], cached["b"], key)
+        except (OSError, KeyError, ValueError):
+            pass
+
+        npz = np.load(pca_npz)
+        plan = cls.fold(npz["scaler_mean"], npz["scaler_scale"], npz["pca_components"], npz["pca_mean"], key)
+        try:
+            np.savez(cache_path, W=plan.W, b=plan.b, source_key=key)
+            print("[AI] Projection plan compiled and cached:", cache_path)
+        except OSError as e:
+            print("[AI] Could not cache projection plan:", e)
+        return plan
+
+    @property
+    def in_dim(self):
+        return self.W.shape[0]
+
+    @property
+    def out_dim(self):
+        return self.W.shape[1]
+
+    # Single window: one GEMV, optionally straight into a (DMA) buffer
+    def project(self, flat, out=None):
+        if out is None:
+            out = np.empty(self.out_dim, dtype=np.float32)
+        np.matmul(flat.reshape(-1), self.W, out=out)
+        np.add(out, self.b, out=out)
+        return out
+
+    # Many windows (N, F) -> (N, D) in one GEMM
+    def project_batch(self, flats, out=None):
+        flats = flats.reshape(-1, self.in_dim)
+        if out is None:
+            out = np.empty((flats.shape[0], self.out_dim), dtype=np.float32)
+        np.matmul(flats, self.W, out=out)
+        np.add(out, self.b, out=out)
+        return out
+
+
+# Inference backends. Callers fill inputs(n)[:n] with PCA vectors and call
+# run(n), which returns (n, CLASSES) logits. `source` is where reloadable
+# weights come from (None when they are fixed, e.g. in the bitstream).
+class InferenceBackend:
+    name = "base"
+    profiler = None
+    source = None
+
+    def inputs(self, n=1):
+        raise NotImplementedError
+
+    def run(self, n=1):
+        raise NotImplementedError
+
+    def infer(self, xs):
+        xs = np.asarray(xs, dtype=np.float32).reshape(-1, self.d_in)
+        out = np.empty((xs.shape[0], self.classes), dtype=np.float32)
+        step = self.max_batch
+        for i in range(0, xs.shape[0], step):
+            n = min(step, xs.shape[0] - i)
+            np.copyto(self.inputs(n)[:n], xs[i:i + n])
+            out[i:i + n] = self.run(n)
+        return out
+
+    def watch_paths(self):
+        return []
+
+    def close(self):
+        pass
+
+
+# FPGA accelerator over AXI DMA (PYNQ)
+class PynqDMABackend(InferenceBackend):
+    name = "pynq"
+
+    def __init__(self, bitfile, d_in, classes, cnn_ip_name="cnn1d_ip_0", dma_name="axi_dma_0", max_batch=8):
+        from pynq import Overlay, allocate
+
         print("[AI] Loading overlay...")
         self._ol = Overlay(bitfile)
         self._ol.download()
@@ -37,9 +398,390 @@ class Ultra96CNNRunner:
         ctrl_after = self._cnn.read(0x00)
         print(f"[AI] CNN CTRL before=0x{ctrl_before:08X}, after=0x{ctrl_after:08X}")
 
-        # Load preprocessing metadata
+        self.d_in = d_in
+        self.classes = classes
+        self.max_batch = max_batch
+
+        # DMA buffers, sized for a whole batch
+        self._in_buf = allocate(shape=(max_batch, d_in), dtype=np.float32)
+        self._out_buf = allocate(shape=(max_batch, classes), dtype=np.float32)
+
+    def inputs(self, n=1):
+        return self._in_buf
+
+    # All n inputs go out in one MM2S transaction. The IP (AUTO_RESTART) emits
+    # one TLAST-terminated packet per input and S2MM stops at TLAST, so the
+    # receive side is re-armed per result while the send is in flight.
+    def run(self, n=1):
+        out_bytes = self.classes * 4
+        recv = self._dma.recvchannel
+        send = self._dma.sendchannel
+
+        prof = self.profiler
+        t0 = time.perf_counter_ns()
+        recv.transfer(self._out_buf, start=0, nbytes=out_bytes)
+        send.transfer(self._in_buf, nbytes=n * self.d_in * 4)
+        t1 = time.perf_counter_ns()
+        for i in range(1, n):
+            recv.wait()
+            recv.transfer(self._out_buf, start=i * out_bytes, nbytes=out_bytes)
+        recv.wait()
+        send.wait()
+        if prof:
+            t2 = time.perf_counter_ns()
+            prof.span("dma_send", t0, t1)
+            prof.span("dma_recv_wait", t1, t2)
+        return np.copy(self._out_buf[:n])
+
+    def close(self):
+        try: self._in_buf.freebuffer()
+        except: pass
+        try: self._out_buf.freebuffer()
+        except: pass
+
+
+# CPU reference of cnn1d_ip: Conv1D(k=3, same, ReLU) -> Flatten -> Dense,
+# vectorised over a batch of inputs
+class NumpyCNNBackend(InferenceBackend):
+    name = "cpu"
+
+    def __init__(self, conv_w, conv_b, dense_w, dense_b, max_batch=256):
+        self.conv_w = np.ascontiguousarray(conv_w, dtype=np.float32)    # (CONV1_OUT, KERNEL)
+        self.conv_b = np.ascontiguousarray(conv_b, dtype=np.float32)    # (CONV1_OUT,)
+        self.dense_w = np.ascontiguousarray(dense_w, dtype=np.float32)  # (D_IN*CONV1_OUT, CLASSES)
+        self.dense_b = np.ascontiguousarray(dense_b, dtype=np.float32)  # (CLASSES,)
+
+        filters, kernel = self.conv_w.shape
+        if kernel != 3:
+            raise ValueError(f"Expected KERNEL=3, got {kernel}")
+        if self.dense_w.shape[0] % filters != 0:
+            raise ValueError("Dense input size is not a multiple of CONV1_OUT")
+        self.d_in = self.dense_w.shape[0] // filters
+        self.classes = self.dense_w.shape[1]
+        self.max_batch = max_batch
+
+        # Zero-padded input so the 3 taps are plain slices
+        self._pad = np.zeros((max_batch, self.d_in + 2), dtype=np.float32)
+
+    @staticmethod
+    def _read_header_array(path, name):
+        with open(path, "r") as f:
+            text = f.read()
+        m = re.search(r"float\s+%s((?:\[\d+\])+)\s*=\s*\{(.*?)\};" % name, text, re.S)
+        if not m:
+            raise ValueError(f"{name} not found in {path}")
+        shape = tuple(int(d) for d in re.findall(r"\d+", m.group(1)))
+        vals = np.array(re.findall(r"[-+]?\d*\.?\d+(?:[eE][-+]?\d+)?", m.group(2)), dtype=np.float32)
+        return vals.reshape(shape)
+
+    HLS_FILES = ("conv1_weights.h", "conv1_bias.h", "dense_weights.h", "dense_bias.h")
+
+    @classmethod
+    def from_hls_params(cls, params_dir, **kw):
+        rd = cls._read_header_array
+        files = [os.path.join(params_dir, name) for name in cls.HLS_FILES]
+        backend = cls(
+            rd(files[0], "CONV1_W"),
+            rd(files[1], "CONV1_B"),
+            rd(files[2], "DENSE_W"),
+            rd(files[3], "DENSE_B"),
+            **kw,
+        )
+        backend.source = params_dir
+        return backend
+
+    @classmethod
+    def from_keras(cls, model_path, **kw):
+        from tensorflow import keras
+
+        mdl = keras.models.load_model(model_path, compile=False)
+        wc, bc = mdl.get_layer("conv1").get_weights()
+        wd, bd = mdl.get_layer("softmax").get_weights()
+        backend = cls(np.transpose(wc[:, 0, :]), bc, wd, bd, **kw)
+        backend.source = model_path
+        return backend
+
+    # HLS_PARAMS directory or .keras model
+    @classmethod
+    def load(cls, source, **kw):
+        return cls.from_keras(source, **kw) if source.endswith(".keras") else cls.from_hls_params(source, **kw)
+
+    def watch_paths(self):
+        if self.source is None:
+            return []
+        if self.source.endswith(".keras"):
+            return [self.source]
+        return [os.path.join(self.source, name) for name in self.HLS_FILES]
+
+    def inputs(self, n=1):
+        if n > self.max_batch:
+            self.max_batch = n
+            self._pad = np.zeros((n, self.d_in + 2), dtype=np.float32)
+        return self._pad[:, 1:-1]
+
+    def run(self, n=1):
+        xp = self._pad[:n]
+        w = self.conv_w
+        # (n, D_IN, CONV1_OUT)
+        h = xp[:, :-2, None] * w[:, 0] + xp[:, 1:-1, None] * w[:, 1] + xp[:, 2:, None] * w[:, 2]
+        h += self.conv_b
+        np.maximum(h, 0.0, out=h)
+        return h.reshape(n, -1).dot(self.dense_w) + self.dense_b
+
+
+# Decides which ready windows are inferred:
+#   "frames": every `hop` frames
+#   "packet": last frame of each pushed packet
+#   "rate":   at most `max_rate` inferences per second (wall clock)
+class InferenceScheduler:
+    MODES = ("frames", "packet", "rate")
+
+    def __init__(self, mode="frames", hop=1, max_rate=None):
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown schedule mode {mode!r}, expected one of {self.MODES}")
+        if mode == "rate" and not max_rate:
+            raise ValueError("Schedule mode 'rate' needs max_rate")
+        self.mode = mode
+        self.hop = max(1, int(hop))
+        self.min_interval = 1.0 / max_rate if max_rate else 0.0
+        self._since = 0
+        self._last_t = None
+        self._skip_t = None
+
+    def reset(self):
+        self._since = 0
+        self._last_t = None
+        self._skip_t = None
+
+    # claim=False is for backlog accounting: the stride still advances, but in
+    # "rate" mode skipped slots are tracked apart so real inferences are not delayed
+    def due(self, last_in_packet=True, claim=True):
+        if self.mode == "frames":
+            self._since += 1
+            if self._since < self.hop:
+                return False
+            self._since = 0
+            return True
+
+        if self.mode == "packet":
+            return last_in_packet
+
+        now = time.monotonic()
+        last = self._last_t if self._last_t is not None else -np.inf
+        if not claim and self._skip_t is not None:
+            last = max(last, self._skip_t)
+        if now - last < self.min_interval:
+            return False
+        if claim:
+            self._last_t = now
+        else:
+            self._skip_t = now
+        return True
+
+
+# Idle-window gate: motion is the mean gyro std per segment, maxed over the
+# newest `segments` segments. Below `threshold` the window is reported as
+# class 0 without summarizing, projecting or touching the accelerator.
+# Calibrate with calibrate_motion_gate.py.
+class MotionGate:
+    GYRO_CHANNELS = [imu * 6 + k for imu in range(5) for k in (3, 4, 5)]
+
+    def __init__(self, threshold, segments=1, channels=None):
+        self.threshold = float(threshold)
+        self.segments = int(segments)
+        self.channels = list(channels) if channels is not None else self.GYRO_CHANNELS
+        self.checked = 0
+        self.gated = 0
+
+    def score(self, summarizer):
+        return float(summarizer.newest_std(self.segments)[:, self.channels].mean(axis=1).max())
+
+    def idle(self, summarizer):
+        self.checked += 1
+        if self.score(summarizer) < self.threshold:
+            self.gated += 1
+            return True
+        return False
+
+    def hit_rate(self):
+        return self.gated / self.checked if self.checked else 0.0
+
+    def report(self):
+        return (f"[GATE] threshold={self.threshold:.3f}  checked={self.checked}  "
+                f"gated={self.gated}  hit_rate={self.hit_rate() * 100:.1f}%")
+
+
+# Temporal decision stage: turns the stream of per-window class probabilities
+# into confirmed gestures. Time is stream time (frames / FRAME_HZ), so every
+# setting means the same at any inference stride. probs=None marks a window
+# the motion gate skipped and counts as a certain "none".
+#   "debounce": thresholded argmax held for hold_s (the original rule)
+#   "ema":      exponential average of probabilities, time constant tau_s
+#   "window":   mean probabilities over the last window_s seconds
+#   "vote":     a class wins k of the last n thresholded windows
+# All engines use per-class thresholds and a refractory period after a trigger.
+class DecisionEngine:
+    def __init__(self, classes, thresholds=0.5, refractory_s=3.0):
+        self.classes = int(classes)
+        self.thresholds = np.broadcast_to(np.asarray(thresholds, dtype=np.float32), (self.classes,)).copy()
+        self.refractory_s = float(refractory_s)
+        self._none = np.zeros(self.classes, dtype=np.float32)
+        self._none[0] = 1.0
+        self.reset()
+
+    def reset(self):
+        self.refractory_until = -np.inf
+
+    def update(self, probs, t):
+        cls = self.candidate(self._none if probs is None else probs, t)
+        if cls == 0 or t < self.refractory_until:
+            return 0
+        self.refractory_until = t + self.refractory_s
+        return cls
+
+    def candidate(self, probs, t):
+        raise NotImplementedError
+
+    def _thresholded(self, probs):
+        cls = int(np.argmax(probs))
+        return cls if cls != 0 and probs[cls] >= self.thresholds[cls] else 0
+
+    def describe(self):
+        return {"engine": self.kind, "thresholds": [round(float(x), 4) for x in self.thresholds],
+                "refractory_s": self.refractory_s}
+
+
+class DebounceDecision(DecisionEngine):
+    kind = "debounce"
+
+    def __init__(self, classes, hold_s=0.02, **kw):
+        self.hold_s = float(hold_s)
+        super().__init__(classes, **kw)
+
+    def reset(self):
+        super().reset()
+        self.last_raw = 0
+        self.streak_start = 0.0
+
+    def candidate(self, probs, t):
+        raw = self._thresholded(probs)
+        if raw != self.last_raw:
+            self.streak_start = t
+        self.last_raw = raw
+        return raw if t - self.streak_start >= self.hold_s - 1e-9 else 0
+
+    def describe(self):
+        return dict(super().describe(), hold_s=self.hold_s)
+
+
+class AccumulateDecision(DecisionEngine):
+    def __init__(self, classes, kind="ema", tau_s=0.1, window_s=0.2, **kw):
+        if kind not in ("ema", "window"):
+            raise ValueError(f"Unknown accumulation {kind!r}")
+        self.kind = kind
+        self.tau_s = float(tau_s)
+        self.window_s = float(window_s)
+        super().__init__(classes, **kw)
+
+    def reset(self):
+        super().reset()
+        self.acc = None
+        self.last_t = None
+        self.hist = deque()
+        self.hist_sum = np.zeros(self.classes, dtype=np.float64)
+
+    def candidate(self, probs, t):
+        if self.kind == "ema":
+            if self.acc is None:
+                self.acc = np.array(probs, dtype=np.float32)
+            else:
+                alpha = 1.0 - np.exp(-max(t - self.last_t, 0.0) / self.tau_s)
+                self.acc += alpha * (probs - self.acc)
+            self.last_t = t
+        else:
+            self.hist.append((t, probs))
+            self.hist_sum += probs
+            while self.hist[0][0] <= t - self.window_s:
+                self.hist_sum -= self.hist.popleft()[1]
+            self.acc = self.hist_sum / len(self.hist)
+        return self._thresholded(self.acc)
+
+    def describe(self):
+        d = super().describe()
+        d["tau_s" if self.kind == "ema" else "window_s"] = self.tau_s if self.kind == "ema" else self.window_s
+        return d
+
+
+class VoteDecision(DecisionEngine):
+    kind = "vote"
+
+    def __init__(self, classes, k=2, n=3, **kw):
+        self.k = int(k)
+        self.n = int(n)
+        super().__init__(classes, **kw)
+
+    def reset(self):
+        super().reset()
+        self.votes = deque(maxlen=self.n)
+
+    def candidate(self, probs, t):
+        self.votes.append(self._thresholded(probs))
+        counts = np.bincount(np.asarray(self.votes), minlength=self.classes)
+        counts[0] = 0
+        cls = int(np.argmax(counts))
+        return cls if counts[cls] >= self.k else 0
+
+    def describe(self):
+        return dict(super().describe(), k=self.k, n=self.n)
+
+
+DECISION_ENGINES = ("debounce", "ema", "window", "vote")
+
+
+def make_decision_engine(cfg, class_names, refractory_s=3.0, hold_s=0.02):
+    """cfg: {"engine": ..., "thresholds": float | list | {class_name: thr, "default": thr},
+    "refractory_s": s, plus hold_s / tau_s / window_s / k, n}; missing timings use the defaults"""
+    cfg = dict(cfg or {})
+    kind = cfg.pop("engine", "debounce")
+    classes = len(class_names)
+    thr = cfg.pop("thresholds", 0.5)
+    if isinstance(thr, dict):
+        default = float(thr.get("default", 0.5))
+        thr = [float(thr.get(name, thr.get(str(i), default))) for i, name in enumerate(class_names)]
+    kw = {"thresholds": thr, "refractory_s": float(cfg.pop("refractory_s", refractory_s))}
+    if kind == "debounce":
+        engine = DebounceDecision(classes, hold_s=cfg.pop("hold_s", hold_s), **kw)
+    elif kind in ("ema", "window"):
+        engine = AccumulateDecision(classes, kind, tau_s=cfg.pop("tau_s", 0.1),
+                                    window_s=cfg.pop("window_s", 0.2), **kw)
+    elif kind == "vote":
+        engine = VoteDecision(classes, k=cfg.pop("k", 2), n=cfg.pop("n", 3), **kw)
+    else:
+        raise ValueError(f"Unknown decision engine {kind!r}, expected one of {DECISION_ENGINES}")
+    if cfg:
+        raise ValueError(f"Unknown decision settings for {kind!r}: {sorted(cfg)}")
+    # settings that would divide by zero or never trigger
+    if kind == "ema" and not engine.tau_s > 0:
+        raise ValueError(f"tau_s must be > 0, got {engine.tau_s}")
+    if kind == "window" and not engine.window_s > 0:
+        raise ValueError(f"window_s must be > 0, got {engine.window_s}")
+    if kind == "vote" and not 1 <= engine.k <= engine.n:
+        raise ValueError(f"vote needs 1 <= k <= n, got k={engine.k} n={engine.n}")
+    if not np.all((engine.thresholds >= 0) & (engine.thresholds <= 1)):
+        raise ValueError(f"thresholds must be in [0, 1], got {[round(float(x), 4) for x in engine.thresholds]}")
+    return engine
+
+
+# One consistent set of preprocessing artifacts: meta.json and the scaler/PCA
+# npz, folded into a ProjectionPlan. Loading checks the pieces against each
+# other; check_backend checks them against the accelerator.
+class ArtifactSet:
+    def __init__(self, meta_path, pca_npz, feats_per_row=30):
         with open(meta_path, "r") as f:
             meta = json.load(f)
+        self.meta_path = meta_path
+        self.pca_npz = pca_npz
+        self.meta = meta
 
         self.WINDOW = int(meta["window"])
         self.NUM_SEGMENTS = int(meta["num_segments"])
@@ -47,33 +789,294 @@ class Ultra96CNNRunner:
         self.D_IN = int(meta["D_pca"])
         self.CLASSES = int(meta["classes"])
         self.class_names = list(meta.get("class_names", [str(i) for i in range(self.CLASSES)]))
+        if len(self.class_names) != self.CLASSES:
+            raise ValueError(f"meta has {len(self.class_names)} class_names for {self.CLASSES} classes")
 
-        # PCA and scaler
         npz = np.load(pca_npz)
         self.scaler_mean = npz["scaler_mean"]
         self.scaler_scale = npz["scaler_scale"]
         self.pca_components = npz["pca_components"]
         self.pca_mean = npz["pca_mean"]
+        self.plan = ProjectionPlan.load(pca_npz, os.path.dirname(meta_path))
+
+        f_flat = self.NUM_SEGMENTS * len(self.STATS_LIST) * feats_per_row
+        if (self.plan.in_dim, self.plan.out_dim) != (f_flat, self.D_IN):
+            raise ValueError(f"PCA maps {self.plan.in_dim} -> {self.plan.out_dim}, "
+                             f"meta expects {f_flat} -> {self.D_IN}")
 
-        print(f"[AI] Model expects D_IN={self.D_IN}, CLASSES={self.CLASSES}, WINDOW={self.WINDOW}")
+    def check_backend(self, backend):
+        if backend.d_in != self.D_IN or backend.classes != self.CLASSES:
+            raise ValueError(f"Backend shape ({backend.d_in}, {backend.classes}) "
+                             f"does not match meta ({self.D_IN}, {self.CLASSES})")
 
-        # Sliding window
+    # Geometry of the sliding window; a change means the window has to refill
+    def window_key(self):
+        return (self.WINDOW, self.NUM_SEGMENTS, tuple(self.STATS_LIST))
+
+
+# Polls the artifact files (and reloadable backend weights) and hands a
+# changed set to runner.reload_artifacts once the files have stopped
+# changing for one poll, so half-copied files are never loaded.
+class ArtifactWatcher:
+    def __init__(self, runner, poll_s=2.0):
+        self.runner = runner
+        self.poll_s = float(poll_s)
+        # Baseline is taken once the backend (and its weight files) is attached
+        self._loaded = self._signature() if runner.backend_ready.is_set() else None
+        self._seen = self._loaded
+
+    def _signature(self):
+        sig = []
+        for path in self.runner.watch_paths():
+            try:
+                st = os.stat(path)
+                sig.append((path, st.st_mtime_ns, st.st_size))
+            except OSError:
+                sig.append((path, None, None))
+        return tuple(sig)
+
+    def poll(self):
+        # Nothing to swap into before the backend is attached (see fast start)
+        if not self.runner.backend_ready.is_set():
+            return False
+        sig = self._signature()
+        if self._loaded is None:
+            self._loaded = self._seen = sig
+            return False
+        stable = sig == self._seen
+        self._seen = sig
+        if not stable or sig == self._loaded or any(mtime is None for _, mtime, _ in sig):
+            return False
+        self._loaded = sig
+        try:
+            self.runner.reload_artifacts()
+            return True
+        except Exception as e:
+            print("[ERR] Artifact reload rejected, keeping the current set:", e)
+            return False
+
+    def _loop(self):
+        while True:
+            time.sleep(self.poll_s)
+            self.poll()
+
+    def start(self):
+        print(f"[AI] Watching artifacts every {self.poll_s:.1f} s")
+        Thread(target=self._loop, daemon=True).start()
+        return self
+
+
+# Ultra96 Hardware CNN Runner
+class Ultra96CNNRunner:
+    def __init__(
+        self,
+        bitfile="cnn_overlay_11.xsa",
+        meta_path="artifacts_tf/meta.json",
+        pca_npz="artifacts_tf/pca_params_summarizer.npz",
+        cnn_ip_name="cnn1d_ip_0",
+        dma_name="axi_dma_0",
+        backend=None,
+        hop=None,
+        schedule="frames",
+        max_rate=None,
+        frame_hz=50.0,
+        debounce_s=None,
+        cooldown_s=3.0,
+        gate_threshold=None,
+        gate_segments=None,
+        profiler: Optional[StageProfiler] = None,
+        decision=None,
+        defer_backend=False,
+        startup: Optional[StartupTimer] = None,
+    ):
+        # Opt-in stage profiling
+        self.profiler = profiler
+        self.startup = startup if startup is not None else StartupTimer()
+
+        # Inference backend: an InferenceBackend, a callable that builds one, or
+        # None for the FPGA. Builders run on a loader thread in parallel with the
+        # artifact load; with defer_backend the runner is usable (rows are pushed
+        # into the window, nothing is inferred) before the backend is attached.
+        self._backend = None
+        self.backend_ready = Event()
+        self.backend_error = None
+        self._artifacts_loaded = Event()
+        loader = None
+        if not isinstance(backend, InferenceBackend):
+            if backend is None:
+                with open(meta_path, "r") as f:
+                    m = json.load(f)
+                backend = (lambda d_in=int(m["D_pca"]), classes=int(m["classes"]):
+                           PynqDMABackend(bitfile, d_in, classes, cnn_ip_name, dma_name))
+            loader = Thread(target=self._load_backend, args=(backend,), daemon=True)
+            loader.start()
+
+        # Preprocessing metadata, scaler and PCA (hot-reloadable, see reload_artifacts)
         self.FEATS_PER_ROW = 30
-        self._buf = deque(maxlen=self.WINDOW)
+        with self.startup.phase("artifacts"):
+            art = ArtifactSet(meta_path, pca_npz, self.FEATS_PER_ROW)
+        meta = art.meta
+        print(f"[AI] Model expects D_IN={art.D_IN}, CLASSES={art.CLASSES}, WINDOW={art.WINDOW}")
 
         # Tracks when each full window is completed
         self.window_ready_timestamp = None
 
-        # DMA buffers
-        self._in_buf = allocate(shape=(self.D_IN,), dtype=np.float32)
-        self._out_buf = allocate(shape=(self.CLASSES,), dtype=np.float32)
+        # Artifact set staged by reload_artifacts, swapped in by the inference thread
+        self.artifacts = None
+        self._pending = None
+        self._reload_lock = Lock()
+        self._apply_artifacts(art, None)
+        if loader is None:
+            self.attach_backend(backend)
+        self._artifacts_loaded.set()
+        if loader is not None and not defer_backend:
+            loader.join()
+            if self.backend_error is not None:
+                raise self.backend_error
+
+        # Decision stage on stream time (frames / FRAME_HZ). Settings come from
+        # `decision` (engine, config dict or JSON path), else meta.json "decision",
+        # else the original debounce (DEBOUNCE_S) + cooldown (COOLDOWN_S) rule
+        self.FRAME_HZ = float(frame_hz)
+        self.DEBOUNCE_S = float(debounce_s) if debounce_s is not None else 1.0 / self.FRAME_HZ
+        self.COOLDOWN_S = float(cooldown_s)
+        if isinstance(decision, str):
+            with open(decision, "r") as f:
+                decision = json.load(f)
+        # Only a decision config that came from meta.json follows artifact reloads
+        self._decision_from_meta = decision is None
+        if not isinstance(decision, DecisionEngine):
+            decision = make_decision_engine(decision if decision is not None else meta.get("decision"),
+                                            self.class_names, self.COOLDOWN_S, self.DEBOUNCE_S)
+        self.decision = decision
+        print("[AI] Decision:", json.dumps(decision.describe()))
+
+        # Inference stride
+        self.HOP = int(hop) if hop is not None else int(meta.get("hop", 1))
+        self.scheduler = InferenceScheduler(schedule, self.HOP, max_rate)
+
+        # Optional idle-window gate
+        self.gate = None
+        if gate_threshold is not None:
+            self.gate = MotionGate(gate_threshold, gate_segments or self.NUM_SEGMENTS)
+
+    @property
+    def backend_name(self):
+        return self._backend.name if self._backend is not None else "loading"
+
+    def _load_backend(self, build):
+        try:
+            with self.startup.phase("backend"):
+                backend = build()
+            self._artifacts_loaded.wait()
+            self.attach_backend(backend)
+        except Exception as e:
+            self.backend_error = e
+            print("[ERR] Backend load failed:", e)
+
+    def attach_backend(self, backend):
+        self.artifacts.check_backend(backend)
+        backend.profiler = self.profiler
+        self._backend = backend
+        print("[AI] Inference backend:", backend.name)
+        self.backend_ready.set()
+
+    def _apply_artifacts(self, art, backend):
+        old = self.artifacts
+        self.artifacts = art
+        self.WINDOW = art.WINDOW
+        self.NUM_SEGMENTS = art.NUM_SEGMENTS
+        self.STATS_LIST = art.STATS_LIST
+        self.D_IN = art.D_IN
+        self.CLASSES = art.CLASSES
+        self.class_names = art.class_names
+        self.scaler_mean = art.scaler_mean
+        self.scaler_scale = art.scaler_scale
+        self.pca_components = art.pca_components
+        self.pca_mean = art.pca_mean
+        self._plan = art.plan
+        if backend is not None:
+            self._backend = backend
+            backend.profiler = self.profiler
+
+        # Same window geometry: keep the window, its summaries stay valid
+        restart = old is None or old.window_key() != art.window_key()
+        if restart:
+            # Summaries of the windows completed by one batch of rows
+            self._seg_batch = np.zeros((8, self.NUM_SEGMENTS, self._plan.in_dim // self.NUM_SEGMENTS),
+                                       dtype=np.float32)
+
+            # Sliding window
+            self._buf = WindowRing(self.WINDOW, self.FEATS_PER_ROW)
+            self._summ = IncrementalSummarizer(self.WINDOW, self.NUM_SEGMENTS, self.STATS_LIST, self.FEATS_PER_ROW)
+            self.window_ready_timestamp = None
+        return restart
+
+    def watch_paths(self):
+        return [self.artifacts.meta_path, self.artifacts.pca_npz] + self._backend.watch_paths()
+
+    # Load and validate a new artifact set (default: the same paths again) on
+    # the calling thread, then stage it; the inference thread swaps it in
+    # before its next batch. The overlay and MQTT connection are untouched.
+    # Raises (and keeps the current set) when the new set does not fit.
+    def reload_artifacts(self, meta_path=None, pca_npz=None):
+        t0 = time.perf_counter()
+        art = ArtifactSet(meta_path or self.artifacts.meta_path, pca_npz or self.artifacts.pca_npz,
+                          self.FEATS_PER_ROW)
+        backend = self._backend
+        if backend.source is not None:
+            backend = type(backend).load(backend.source, max_batch=backend.max_batch)
+        art.check_backend(backend)
 
-        # Debounce and cooldown logic
-        self.last_raw_pred = 0
-        self.prev_filtered_pred = 0
-        self.cooldown_until = 0
+        decision = None
+        if self._decision_from_meta:
+            decision = make_decision_engine(art.meta.get("decision"), art.class_names,
+                                            self.COOLDOWN_S, self.DEBOUNCE_S)
+            if decision.describe() == self.decision.describe():
+                decision = None
+        elif self.decision.classes != art.CLASSES:
+            raise ValueError(f"Decision engine is set up for {self.decision.classes} classes, "
+                             f"new meta has {art.CLASSES}")
+        # Dry run on a throwaway engine: a setting that cannot run is rejected
+        # here instead of failing on the inference thread after the swap
+        cfg = art.meta.get("decision") if self._decision_from_meta else self.decision.describe()
+        make_decision_engine(cfg, art.class_names, self.COOLDOWN_S, self.DEBOUNCE_S).update(None, 0.0)
 
-        self.HOP = 4
+        with self._reload_lock:
+            self._pending = (art, backend, decision)
+        print(f"[AI] Artifacts staged in {(time.perf_counter() - t0) * 1000:.0f} ms "
+              f"(plan {art.plan.source_key[:8]}, D_IN={art.D_IN}, CLASSES={art.CLASSES}, "
+              f"weights {'reloaded' if backend is not self._backend else 'kept'})")
+        return art
+
+    # Called by the inference thread between batches
+    def _swap_pending(self):
+        with self._reload_lock:
+            pending, self._pending = self._pending, None
+        art, backend, decision = pending
+        old_backend = self._backend
+        if self._apply_artifacts(art, backend):
+            print("[AI] Window geometry changed, window restarts")
+            self.scheduler.reset()
+            self.decision.reset()
+        if decision is not None:
+            self.decision = decision
+            print("[AI] Decision:", json.dumps(decision.describe()))
+        if backend is not old_backend:
+            old_backend.close()
+        print("[AI] Artifacts swapped in:", art.meta_path)
+
+    # Forget the current window and decision state (e.g. between sessions)
+    def reset(self):
+        self._buf.reset()
+        self._summ.reset()
+        self.scheduler.reset()
+        self.window_ready_timestamp = None
+        self.decision.reset()
+
+    # Seconds of data seen, at the nominal frame rate
+    def stream_time(self):
+        return self._buf.count / self.FRAME_HZ
 
     def window_ready(self):
         return len(self._buf) >= self.WINDOW
@@ -86,12 +1089,27 @@ class Ultra96CNNRunner:
         if self.window_ready():
             self.window_ready_timestamp = datetime.now()
 
-        self._buf.append(row_30.astype(np.float32))
+        row = self._buf.push(row_30)
+        self._summ.push(row)
 
         # First time buffer becomes full
         if len(self._buf) == self.WINDOW and self.window_ready_timestamp is None:
             self.window_ready_timestamp = datetime.now()
 
+    # Append rows without inferring; the scheduler advances as if they had been
+    # inferred. Returns how many windows were due (i.e. inferences skipped)
+    def push_rows(self, rows):
+        if self._pending is not None:
+            self._swap_pending()
+        rows = np.asarray(rows).reshape(-1, self.FEATS_PER_ROW)
+        skipped = 0
+        last = len(rows) - 1
+        for i, row in enumerate(rows):
+            self.push_row(row)
+            if self.window_ready() and self.scheduler.due(i == last, claim=False):
+                skipped += 1
+        return skipped
+
     @staticmethod
     def readings_to_row(sensor_readings):
         row = []
@@ -108,7 +1126,7 @@ class Ultra96CNNRunner:
                 row.extend([0.0] * 6)
         return np.array(row, dtype=np.float32)
 
-    # Compute statistical features across segments
+    # Compute statistical features across segments (reference for IncrementalSummarizer)
     def _summarize_window(self, win_2d):
         W = win_2d.shape[0]
         feats = []
@@ -124,7 +1142,7 @@ class Ultra96CNNRunner:
             feats.append(np.concatenate(parts))
         return np.stack(feats).astype(np.float32)
 
-    # PCA logic
+    # PCA logic (reference for ProjectionPlan)
     def _apply_scaler_pca(self, flat):
         flat = flat.reshape(-1)
         flat_scaled = (flat - self.scaler_mean) / self.scaler_scale
@@ -139,59 +1157,143 @@ class Ultra96CNNRunner:
 
     # Full inference pipeline
     def infer_once(self):
-        if not self.window_ready():
+        if self._pending is not None:
+            self._swap_pending()
+        if not self.window_ready() or self._backend is None:
             return None
 
-        win = np.stack(self._buf, axis=0)
-        seg = self._summarize_window(win)
-        xvec = self._apply_scaler_pca(seg.reshape(-1))
-        np.copyto(self._in_buf, xvec)
+        if self.gate is not None and self.gate.idle(self._summ):
+            return self.decision.update(None, self.stream_time())
+
+        prof = self.profiler
+        t0 = time.perf_counter_ns()
+        seg = self._summ.summary()
+        t1 = time.perf_counter_ns()
+        self._plan.project(seg, out=self._backend.inputs(1)[0])
+        t2 = time.perf_counter_ns()
 
         try:
-            self._dma.recvchannel.transfer(self._out_buf)
-            self._dma.sendchannel.transfer(self._in_buf)
-            self._dma.sendchannel.wait()
-            self._dma.recvchannel.wait()
+            logits = self._backend.run(1)[0]
         except Exception as e:
-            print("[ERR] DMA:", e)
+            print(f"[ERR] {self._backend.name}:", e)
             return None
 
-        logits = np.copy(self._out_buf)
-        probs = self._softmax(logits)
+        t3 = time.perf_counter_ns()
+        pred = self._postprocess(logits, self.stream_time())
+        if prof:
+            prof.span("summarize", t0, t1)
+            prof.span("projection", t1, t2)
+            prof.span("backend", t2, t3)
+            prof.span("postprocess", t3, time.perf_counter_ns())
+        return pred
 
-        raw_pred = int(np.argmax(probs))
-        max_prob = float(probs[raw_pred])
+    # Push a block of rows (e.g. one MQTT packet) and infer every window the
+    # scheduler picks as one batch. Returns (confirmed_pred, window_ready_timestamp)
+    # per row, in frame order; pred is None for rows that were not inferred.
+    def infer_batch(self, rows):
+        if self._pending is not None:
+            self._swap_pending()
+        rows = np.asarray(rows).reshape(-1, self.FEATS_PER_ROW)
+        if self._backend is None:
+            # Backend still loading: fill the window so it is ready when the backend is
+            self.push_rows(rows)
+            return [(None, self.window_ready_timestamp)] * len(rows)
+        if rows.shape[0] > self._seg_batch.shape[0]:
+            self._seg_batch = np.zeros((rows.shape[0],) + self._seg_batch.shape[1:], dtype=np.float32)
 
-        # Confidence threshold
-        if raw_pred != 0 and max_prob < 0.5:
-            raw_pred = 0
+        # Profiled per row: "push" is the ring write + incremental stats,
+        # "gate" the idle check, "summarize" only the summary gather
+        prof = self.profiler
+        stamps = []
+        n = 0
+        last = len(rows) - 1
+        for i, row in enumerate(rows):
+            if prof:
+                t0 = time.perf_counter_ns()
+            self.push_row(row)
+            if prof:
+                prof.span("push", t0, time.perf_counter_ns())
+            if not (self.window_ready() and self.scheduler.due(i == last)):
+                stamps.append((self.window_ready_timestamp, None, None))
+                continue
+            if self.gate is not None:
+                if prof:
+                    t0 = time.perf_counter_ns()
+                idle = self.gate.idle(self._summ)
+                if prof:
+                    prof.span("gate", t0, time.perf_counter_ns())
+                if idle:
+                    stamps.append((self.window_ready_timestamp, self.stream_time(), False))
+                    continue
+            if prof:
+                t0 = time.perf_counter_ns()
+            self._seg_batch[n] = self._summ.summary()
+            if prof:
+                prof.span("summarize", t0, time.perf_counter_ns())
+            n += 1
+            stamps.append((self.window_ready_timestamp, self.stream_time(), True))
 
-        # Two consecutive rule
-        confirmed = raw_pred if (raw_pred != 0 and raw_pred == self.last_raw_pred) else 0
-        self.last_raw_pred = raw_pred
+        logits = None
+        if n:
+            try:
+                logits = self._run_batch(self._seg_batch[:n])
+            except Exception as e:
+                print(f"[ERR] {self._backend.name}:", e)
 
-        # Cooldown
-        now = time.time()
-        if confirmed != 0:
-            if now < self.cooldown_until:
-                confirmed = 0
+        t0 = time.perf_counter_ns()
+        results = []
+        k = 0
+        for ts, t, inferred in stamps:
+            if inferred is None:
+                results.append((None, ts))
+            elif not inferred:
+                results.append((self.decision.update(None, t), ts))
+            elif logits is None:
+                results.append((None, ts))
             else:
-                self.cooldown_until = now + 3
+                results.append((self._postprocess(logits[k], t), ts))
+            k += bool(inferred)
+        if prof:
+            prof.span("postprocess", t0, time.perf_counter_ns())
+        return results
 
-        self.prev_filtered_pred = confirmed
-        return confirmed
+    # Project and run window summaries in chunks of the backend batch size
+    def _run_batch(self, segs):
+        n = segs.shape[0]
+        step = self._backend.max_batch
+        logits = np.empty((n, self.CLASSES), dtype=np.float32)
+        for i in range(0, n, step):
+            k = min(step, n - i)
+            t0 = time.perf_counter_ns()
+            self._plan.project_batch(segs[i:i + k], out=self._backend.inputs(k)[:k])
+            t1 = time.perf_counter_ns()
+            logits[i:i + k] = self._backend.run(k)
+            if self.profiler:
+                self.profiler.span("projection", t0, t1)
+                self.profiler.span("backend", t1, time.perf_counter_ns())
+        return logits
+
+    # Softmax, then the decision engine, for one window
+    def _postprocess(self, logits, t):
+        return self.decision.update(self._softmax(logits), t)
 
     def close(self):
-        try: self._in_buf.freebuffer()
-        except: pass
-        try: self._out_buf.freebuffer()
-        except: pass
+        if self.gate is not None:
+            print(self.gate.report())
+        if self.profiler is not None:
+            print(self.profiler.report())
+            self.profiler.write_trace()
+        if self._backend is not None:
+            self._backend.close()
 
 
 
 # MQTT Subscriber
 class Ultra96MQTTSubscriber:
-    def __init__(self):
+    # `make_ai` builds the runner inside start(), after the broker connect has
+    # begun (default: FPGA runner with a deferred backend), see start()
+    def __init__(self, ai: Optional[Ultra96CNNRunner] = None, client=None, make_ai=None,
+                 startup: Optional[StartupTimer] = None):
         self.session_counter = 1000
 
         self.MQTT_BROKER = "localhost"
@@ -199,135 +1301,299 @@ class Ultra96MQTTSubscriber:
 
         self.topic_sensor_to_ultra96 = "robot/sensor/to_ultra96"
         self.topic_processed_data = "ultra96/processed/to_firebeetle"
+        # Retained readiness + startup timings ("loading" / "ready" / "offline")
+        self.topic_status = "ultra96/status"
 
         self.TLS_CA   = "/etc/mosquitto/certs/ca.crt"
         self.TLS_CERT = "/etc/mosquitto/certs/ultra96.crt"
         self.TLS_KEY  = "/etc/mosquitto/certs/ultra96.key"
 
-        self.client = mqtt.Client(client_id="ultra96_subscriber_tls", userdata=self)
-        self.client.tls_set(
-            ca_certs=self.TLS_CA,
-            certfile=self.TLS_CERT,
-            keyfile=self.TLS_KEY,
-            tls_version=ssl.PROTOCOL_TLSv1_2,
-        )
-        self.client.tls_insecure_set(True)
+        # `client` lets tools swap in an in-process transport (see replay_sessions.py)
+        if client is None:
+            client = mqtt.Client(client_id="ultra96_subscriber_tls", userdata=self)
+            client.tls_set(
+                ca_certs=self.TLS_CA,
+                certfile=self.TLS_CERT,
+                keyfile=self.TLS_KEY,
+                tls_version=ssl.PROTOCOL_TLSv1_2,
+            )
+            client.tls_insecure_set(True)
+            client.will_set(self.topic_status, json.dumps({"status": "offline"}), qos=1, retain=True)
+        self.client = client
 
         self.client.on_connect = self.on_connect
         self.client.on_message = self.on_message
 
-        self.work_queue = Queue(maxsize=10)
-        Thread(target=self._worker_loop, daemon=True).start()
+        # Every received frame is queued and pushed in order; only inference
+        # on stale packets is skipped when the worker falls behind
+        self.work_queue = Queue(maxsize=256)
+        self.frames_received = 0
+        self.frames_dropped = 0
+        self.inferences_skipped = 0
 
-        self.ai = Ultra96CNNRunner()
+        # Optional hook called by the worker as on_packet_done(sess, results)
+        self.on_packet_done = None
+
+        # Frames queue up from the first MQTT message; the worker starts once the runner exists
+        self.startup = startup if startup is not None else (ai.startup if ai is not None else StartupTimer())
+        self.ai = ai
+        self._make_ai = make_ai or (lambda: Ultra96CNNRunner(defer_backend=True, startup=self.startup))
+        self._ai_ready = Event()
+        if ai is not None:
+            self._ai_ready.set()
+        self._connect_start = None
+        Thread(target=self._worker_loop, daemon=True).start()
 
     def on_connect(self, client, userdata, flags, rc):
         print("Connected." if rc == 0 else f"MQTT connect failed {rc}")
+        if rc == 0 and self._connect_start is not None and "mqtt_connect" not in self.startup.phases:
+            self.startup.end("mqtt_connect", self._connect_start)
         client.subscribe(self.topic_sensor_to_ultra96)
+        self.publish_status()
+
+    FRAME_BYTES = 5 * 6 * 4
+
+    # Optional latency-trace trailer appended by the bridge; must match
+    # Comms/latency_trace.py: magic | seq (uint32) | ingress monotonic ns (uint64)
+    TRACE_MAGIC = b"TRC1"
+    TRACE_FMT = "!4sIQ"
+    TRACE_SIZE = struct.calcsize(TRACE_FMT)
 
     @staticmethod
-    def parse_packet_exact_4_frames(raw):
-        expected = 4 * 5 * 6 * 4
-        if len(raw) != expected:
-            return None, f"Invalid size {len(raw)}, expected {expected}"
-        frames = []
-        off = 0
-        for _ in range(4):
+    def split_trace(raw):
+        S = Ultra96MQTTSubscriber
+        if len(raw) % S.FRAME_BYTES == S.TRACE_SIZE and raw[-S.TRACE_SIZE:-S.TRACE_SIZE + 4] == S.TRACE_MAGIC:
+            _, seq, ingress_ns = struct.unpack(S.TRACE_FMT, raw[-S.TRACE_SIZE:])
+            return raw[:-S.TRACE_SIZE], {"seq": seq, "ingress_ns": ingress_ns}
+        return raw, None
+
+    # Hot path: zero-copy big-endian float32 view, one 30-value row per frame.
+    # The byte swap happens once, when rows are copied into the window ring.
+    # frames=None accepts any whole number of frames (the bridge batches a read's lines).
+    @staticmethod
+    def decode_packet(raw, frames=None):
+        n = len(raw) // Ultra96MQTTSubscriber.FRAME_BYTES
+        if frames is not None and n != frames:
+            return None, f"Invalid size {len(raw)}, expected {frames * Ultra96MQTTSubscriber.FRAME_BYTES}"
+        if n == 0 or len(raw) % Ultra96MQTTSubscriber.FRAME_BYTES:
+            return None, f"Invalid size {len(raw)}, expected a multiple of {Ultra96MQTTSubscriber.FRAME_BYTES}"
+        return np.frombuffer(raw, dtype=">f4").reshape(n, 30), None
+
+    # Debug view of a packet as per-IMU dicts (not used on the hot path)
+    @staticmethod
+    def parse_packet(raw, frames=None):
+        rows, err = Ultra96MQTTSubscriber.decode_packet(raw, frames)
+        if err:
+            return None, err
+        out = []
+        for row in rows.tolist():
             frame = []
             for imu_id in range(5):
-                vals = struct.unpack("!6f", raw[off:off+24])
-                off += 24
+                vals = row[imu_id * 6:(imu_id + 1) * 6]
                 frame.append({
                     "sensor_id": imu_id,
                     "acceleration": {"x": vals[0], "y": vals[1], "z": vals[2]},
                     "gyroscope":    {"x": vals[3], "y": vals[4], "z": vals[5]},
                 })
-            frames.append(frame)
-        return frames, None
+            out.append(frame)
+        return out, None
+
+    @staticmethod
+    def parse_packet_exact_4_frames(raw):
+        return Ultra96MQTTSubscriber.parse_packet(raw, 4)
 
     def on_message(self, client, userdata, msg):
-        frames, err = self.parse_packet_exact_4_frames(msg.payload)
+        t0 = time.perf_counter_ns()
+        payload, trace = self.split_trace(msg.payload)
+        frames, err = self.decode_packet(payload)
         if err:
             print("[ERR]", err)
             return
+        t1 = time.perf_counter_ns()
+        ai = self.ai
+        if ai is not None and ai.profiler:
+            ai.profiler.span("decode", t0, t1)
 
-        while not self.work_queue.empty():
-            try: self.work_queue.get_nowait()
-            except Empty: break
-
-        self.work_queue.put_nowait((frames, self.session_counter))
+        self.frames_received += len(frames)
+        try:
+            self.work_queue.put_nowait((frames, self.session_counter, t1, trace))
+        except Full:
+            self.frames_dropped += len(frames)
+            print(f"[WARN] Ingest queue full, dropped {len(frames)} frames")
         self.session_counter += 1
 
     # Main processing worker
     def _worker_loop(self):
+        self._ai_ready.wait()
         while True:
             try:
-                frames, sess = self.work_queue.get(timeout=1.0)
+                packets = [self.work_queue.get(timeout=1.0)]
             except Empty:
                 continue
 
-            for sensor_readings in frames:
-                self.ai.push_row(self.ai.readings_to_row(sensor_readings))
-                pred = self.ai.infer_once()
+            # Backlog: push older packets' frames, infer only on the newest
+            while True:
+                try: packets.append(self.work_queue.get_nowait())
+                except Empty: break
 
-                if pred and pred != 0:
+            rows, sess, t_queued, trace = packets[-1]
+            # one bad packet is logged and dropped; inference keeps running
+            try:
+                for backlog_rows, _, _, _ in packets[:-1]:
+                    self.inferences_skipped += self.ai.push_rows(backlog_rows)
 
-                    ts_ready = self.ai.window_ready_timestamp
-                    ts_ready_str = ts_ready.strftime("%H:%M:%S.%f")[:-3] if ts_ready else "N/A"
+                if self.ai.profiler:
+                    self.ai.profiler.span("queue_wait", t_queued, time.perf_counter_ns())
+                results = self.ai.infer_batch(rows)
+                if self.ai.window_ready() and self.startup.mark("first_window"):
+                    print(f"[START] first full window at {self.startup.events['first_window']:.2f} s")
+                for pred, ts_ready in results:
+                    if pred and pred != 0:
+                        self._publish_prediction(pred, ts_ready, sess, trace, t_queued)
+            except Exception as e:
+                print(f"[ERR] Inference failed on a packet from session {sess}:", repr(e))
+                results = []
+            if self.on_packet_done:
+                self.on_packet_done(sess, results)
 
-                    ts_pred = datetime.now()
-                    ts_pred_str = ts_pred.strftime("%H:%M:%S.%f")[:-3]
+    def _publish_prediction(self, pred, ts_ready, sess, trace=None, t_received_ns=None):
+        ts_ready_str = ts_ready.strftime("%H:%M:%S.%f")[:-3] if ts_ready else "N/A"
 
-                    if ts_ready:
-                        latency_ms = (ts_pred - ts_ready).total_seconds() * 1000
-                        latency_str = f"{latency_ms:.1f} ms"
-                    else:
-                        latency_ms = None
-                        latency_str = "N/A"
+        ts_pred = datetime.now()
+        ts_pred_str = ts_pred.strftime("%H:%M:%S.%f")[:-3]
 
-                    print(f"[PRED] win_ready={ts_ready_str}  pred={ts_pred_str}  "
-                          f"latency={latency_str}  → class={pred}")
+        if ts_ready:
+            latency_ms = (ts_pred - ts_ready).total_seconds() * 1000
+            latency_str = f"{latency_ms:.1f} ms"
+        else:
+            latency_ms = None
+            latency_str = "N/A"
 
-                    payload = {
-                        "session": sess,
-                        "prediction": int(pred),
-                        "window_ready_time": ts_ready.isoformat() if ts_ready else None,
-                        "prediction_time": ts_pred.isoformat(),
-                        "latency_ms": latency_ms,
-                        "status": "success"
-                    }
-                    self.client.publish(self.topic_processed_data, json.dumps(payload), qos=1)
+        print(f"[PRED] win_ready={ts_ready_str}  pred={ts_pred_str}  "
+              f"latency={latency_str}  → class={pred}")
+        if self.startup.mark("first_gesture"):
+            print(f"[START] first gesture at {self.startup.events['first_gesture']:.2f} s")
 
-    def start(self):
-        print("Connecting to MQTT broker...")
-        attempt = 0
-        while attempt < 1000:
-            try:
-                self.client.connect(self.MQTT_BROKER, self.MQTT_PORT, 60)
-                print("Connected.")
-                break
-            except Exception as e:
-                attempt += 1
-                print(f"[MQTT] connect failed {attempt}/1000: {e}")
-                time.sleep(10)
+        payload = {
+            "session": sess,
+            "prediction": int(pred),
+            "window_ready_time": ts_ready.isoformat() if ts_ready else None,
+            "prediction_time": ts_pred.isoformat(),
+            "latency_ms": latency_ms,
+            "status": "success"
+        }
+        # Echo the newest contributing packet's trace, plus time spent on the board
+        if trace is not None:
+            payload["trace"] = dict(trace, runner_ms=(time.perf_counter_ns() - t_received_ns) / 1e6)
+        self.client.publish(self.topic_processed_data, json.dumps(payload), qos=1)
+
+    def ingest_report(self):
+        return (f"[INGEST] frames_received={self.frames_received}  frames_dropped={self.frames_dropped}  "
+                f"inferences_skipped={self.inferences_skipped}  queued={self.work_queue.qsize()}")
 
+    def publish_status(self):
+        ready = self.ai is not None and self.ai.backend_ready.is_set()
+        payload = {
+            "status": "ready" if ready else "loading",
+            "backend": self.ai.backend_name if self.ai is not None else None,
+            "uptime_s": round(self.startup.now(), 3),
+            "frames_received": self.frames_received,
+        }
+        payload.update(self.startup.summary())
+        self.client.publish(self.topic_status, json.dumps(payload), qos=1, retain=True)
+
+    # Fast start: the broker connect (paho network thread, retried with
+    # backoff), artifact load + plan compile (this thread) and backend /
+    # overlay load (runner loader thread) all run at once. Frames are ingested
+    # as soon as MQTT is up and fill the window while the backend loads.
+    def start(self):
+        print("Connecting to MQTT broker in the background...")
+        self._connect_start = self.startup.now()
+        self.client.reconnect_delay_set(min_delay=1, max_delay=8)
+        self.client.connect_async(self.MQTT_BROKER, self.MQTT_PORT, 60)
         self.client.loop_start()
-        print("MQTT loop started.")
 
+        error = None
         try:
+            if self.ai is None:
+                self.ai = self._make_ai()
+                self._ai_ready.set()
+            while not self.ai.backend_ready.wait(1.0):
+                if self.ai.backend_error is not None:
+                    raise RuntimeError(f"backend failed to load: {self.ai.backend_error}")
+            self.startup.mark("ready")
+            self.publish_status()
+            print(self.startup.report())
+
+            last_report = time.monotonic()
             while True:
                 time.sleep(1)
+                if time.monotonic() - last_report >= 10:
+                    last_report = time.monotonic()
+                    print(self.ingest_report())
+                    if self.ai.profiler:
+                        print(self.ai.profiler.report())
         except KeyboardInterrupt:
             print("Shutdown requested.")
+        except Exception as e:
+            error = e
+            raise
         finally:
-            self.client.loop_stop()
+            # The will only covers a lost connection; on a clean exit replace the
+            # retained "ready" ourselves and let it reach the broker first
+            status = {"status": "offline"} if error is None else {"status": "failed", "error": str(error)}
+            try:
+                info = self.client.publish(self.topic_status, json.dumps(status), qos=1, retain=True)
+                info.wait_for_publish(timeout=2)
+            except Exception as e:
+                print("[ERR] Final status not published:", e)
             self.client.disconnect()
-            self.ai.close()
+            self.client.loop_stop()
+            if self.ai is not None:
+                self.ai.close()
 
 
 
 if __name__ == "__main__":
+    import argparse
+
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--backend", choices=["pynq", "cpu"], default="pynq")
+    ap.add_argument("--hls-params", default="artifacts_tf/HLS_PARAMS",
+                    help="HLS_PARAMS directory (or .keras model) for the cpu backend")
+    ap.add_argument("--hop", type=int, default=None, help="infer every N frames (default: meta.json hop)")
+    ap.add_argument("--schedule", choices=InferenceScheduler.MODES, default="frames")
+    ap.add_argument("--max-rate", type=float, default=None, help="inferences per second for --schedule rate")
+    ap.add_argument("--gate", type=float, default=None,
+                    help="motion-gate threshold (see calibrate_motion_gate.py); off by default")
+    ap.add_argument("--gate-segments", type=int, default=None,
+                    help="newest segments the gate looks at (default: whole window)")
+    ap.add_argument("--profile", action="store_true", help="print per-stage timing histograms")
+    ap.add_argument("--trace", default=None, help="write a Chrome trace JSON here (implies --profile)")
+    ap.add_argument("--decision", default=None,
+                    help="decision engine JSON config (see evaluate_decisions.py); default: meta.json or debounce")
+    ap.add_argument("--watch-artifacts", type=float, default=2.0,
+                    help="poll meta.json / PCA npz / cpu weights every N s and hot-swap changes (0 = off)")
+    args = ap.parse_args()
+
     print("=" * 60)
     print(" Ultra96 MQTT Subscriber + CNN (latency-tracked)")
     print("=" * 60)
-    Ultra96MQTTSubscriber().start()
+
+    startup = StartupTimer()
+    # Loaded on the runner's loader thread (None = FPGA overlay)
+    backend = None
+    if args.backend == "cpu":
+        backend = lambda: NumpyCNNBackend.load(args.hls_params)
+    profiler = StageProfiler(args.trace) if (args.profile or args.trace) else None
+
+    # Built by start() once the broker connect is under way
+    def make_ai():
+        ai = Ultra96CNNRunner(backend=backend, hop=args.hop, schedule=args.schedule, max_rate=args.max_rate,
+                              gate_threshold=args.gate, gate_segments=args.gate_segments, profiler=profiler,
+                              decision=args.decision, defer_backend=True, startup=startup)
+        if args.watch_artifacts > 0:
+            ArtifactWatcher(ai, args.watch_artifacts).start()
+        return ai
+
+    Ultra96MQTTSubscriber(make_ai=make_ai, startup=startup).start()
@@ -0,0 +1,226 @@
+import argparse
+import glob
+import json
+import os
+import re
+import numpy as np
+
+from cnn_runner_final import (
+    IncrementalSummarizer, ProjectionPlan, NumpyCNNBackend, MotionGate, Ultra96CNNRunner,
+    make_decision_engine,
+)
+from calibrate_motion_gate import load_csv_rows
+
+
+# Offline evaluation of decision engine configs on recorded ultra96_csv_logger
+# sessions. Each session is scored once with the ungated CPU model (hop 1);
+# every config then replays the same probability stream on stream time.
+#
+# Sessions are labelled by file name, <person>_class_<K>[_<K>...].csv, with
+# class 0 ("none") sessions holding no gestures. Inside gesture sessions the
+# gestures themselves are found from motion: episodes are runs of windows
+# whose newest-segment gyro score is above --motion-threshold, merged across
+# short gaps. Per config:
+#   hit rate      share of episodes with a trigger of a session class between
+#                 episode onset and episode end + --grace (default one window,
+#                 which still holds the gesture after the motion stops)
+#   delay         episode onset -> first such trigger
+#   false / min   every other trigger (any in none sessions, wrong class, or
+#                 outside an episode) per minute of recording
+
+FILE_CLASSES = re.compile(r"_class_(\d+(?:_\d+)*)\.csv$")
+
+DEFAULT_CONFIGS = [
+    {"name": "legacy"},
+    {"engine": "debounce", "hold_s": 0.1},
+    {"engine": "debounce", "hold_s": 0.2},
+    {"engine": "ema", "tau_s": 0.1, "thresholds": 0.6},
+    {"engine": "ema", "tau_s": 0.2, "thresholds": 0.6},
+    {"engine": "ema", "tau_s": 0.2, "thresholds": 0.7},
+    {"engine": "window", "window_s": 0.2, "thresholds": 0.6},
+    {"engine": "window", "window_s": 0.4, "thresholds": 0.6},
+    {"engine": "vote", "k": 3, "n": 5},
+    {"engine": "vote", "k": 5, "n": 8},
+    {"engine": "vote", "k": 8, "n": 10},
+]
+
+
+def session_classes(path):
+    m = FILE_CLASSES.search(os.path.basename(path))
+    return sorted({int(c) for c in m.group(1).split("_")}) if m else None
+
+
+def score_session(rows, summ, plan, backend, gates):
+    """Per window: frame count, softmax probabilities and one score per MotionGate"""
+    summ.reset()
+    frames, scores, segs = [], [], []
+    for i, row in enumerate(rows):
+        summ.push(row)
+        if summ.ready():
+            frames.append(i + 1)
+            scores.append([g.score(summ) for g in gates])
+            segs.append(summ.summary())
+    if not segs:
+        return np.zeros(0), np.zeros((0, backend.classes)), np.zeros((len(gates), 0))
+    logits = backend.infer(plan.project_batch(np.stack(segs)))
+    probs = np.stack([Ultra96CNNRunner._softmax(l) for l in logits])
+    return np.asarray(frames, dtype=np.float64), probs, np.asarray(scores).T
+
+
+def find_episodes(times, scores, threshold, merge_s, min_s):
+    """[(onset, end)] of runs with score >= threshold, joined across gaps < merge_s"""
+    episodes = []
+    for t, active in zip(times, scores >= threshold):
+        if not active:
+            continue
+        if episodes and t - episodes[-1][1] < merge_s:
+            episodes[-1][1] = t
+        else:
+            episodes.append([t, t])
+    return [(a, b) for a, b in episodes if b - a >= min_s]
+
+
+def run_engine(engine, times, probs, gate_scores, gate_threshold):
+    engine.reset()
+    triggers = []
+    for t, p, s in zip(times, probs, gate_scores):
+        cls = engine.update(None if s < gate_threshold else p, t)
+        if cls:
+            triggers.append((t, cls))
+    return triggers
+
+
+def evaluate(engine, sessions, grace_s, gate_threshold):
+    delays, hits, n_episodes, minutes = [], 0, 0, 0.0
+    false = {"none_session": 0, "wrong_class": 0, "outside_episode": 0}
+    for s in sessions:
+        triggers = run_engine(engine, s["times"], s["probs"], s["gate_scores"], gate_threshold)
+        minutes += s["minutes"]
+        used = set()
+        for onset, end in s["episodes"]:
+            n_episodes += 1
+            for j, (t, cls) in enumerate(triggers):
+                if j not in used and cls in s["classes"] and onset <= t <= end + grace_s:
+                    used.add(j)
+                    hits += 1
+                    delays.append(t - onset)
+                    break
+        # later triggers inside an already detected episode are repeats, not false
+        for j, (t, cls) in enumerate(triggers):
+            if j in used:
+                continue
+            if not s["classes"]:
+                false["none_session"] += 1
+            elif cls not in s["classes"]:
+                false["wrong_class"] += 1
+            elif not any(onset <= t <= end + grace_s for onset, end in s["episodes"]):
+                false["outside_episode"] += 1
+    d = np.asarray(delays) if delays else np.full(1, np.nan)
+    return {
+        "episodes": n_episodes,
+        "hit_rate": hits / n_episodes if n_episodes else 0.0,
+        "delay_p50_s": float(np.median(d)),
+        "delay_p90_s": float(np.percentile(d, 90)),
+        "false_triggers": sum(false.values()),
+        "false_per_min": sum(false.values()) / minutes if minutes else 0.0,
+        "false_by_kind": false,
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Detection delay vs false-trigger rate of decision engine configs")
+    ap.add_argument("--artifacts", default="artifacts_tf", help="directory with meta.json, npz and HLS_PARAMS")
+    ap.add_argument("--data", default="raw_data_from_ultra96", help="directory of recorded CSVs")
+    ap.add_argument("--configs", default=None,
+                    help="JSON list of decision configs (default: a built-in sweep); \"name\" is optional")
+    ap.add_argument("--refractory", type=float, default=3.0, help="refractory_s for configs that omit it")
+    ap.add_argument("--frame-hz", type=float, default=50.0)
+    ap.add_argument("--motion-threshold", type=float, default=None,
+                    help="episode motion score (default: 99th percentile of none sessions)")
+    ap.add_argument("--motion-segments", type=int, default=1, help="newest segments the motion score uses")
+    ap.add_argument("--merge", type=float, default=1.0, help="join episodes closer than this (s)")
+    ap.add_argument("--min-episode", type=float, default=0.3, help="drop episodes shorter than this (s)")
+    ap.add_argument("--grace", type=float, default=None,
+                    help="triggers this long after an episode still count (s, default: one window)")
+    ap.add_argument("--gate", type=float, default=0.0, help="evaluate behind a MotionGate with this threshold")
+    ap.add_argument("--json", default=None, help="write the report to this file")
+    args = ap.parse_args()
+
+    with open(os.path.join(args.artifacts, "meta.json"), "r") as f:
+        meta = json.load(f)
+    class_names = list(meta.get("class_names", [str(i) for i in range(int(meta["classes"]))]))
+    summ = IncrementalSummarizer(int(meta["window"]), int(meta["num_segments"]), meta["stats_list"], 30)
+    plan = ProjectionPlan.load(os.path.join(args.artifacts, "pca_params_summarizer.npz"), args.artifacts)
+    backend = NumpyCNNBackend.from_hls_params(os.path.join(args.artifacts, "HLS_PARAMS"))
+    grace = args.grace if args.grace is not None else int(meta["window"]) / args.frame_hz
+    motion = MotionGate(0.0, args.motion_segments)
+    gate = MotionGate(0.0, int(meta["num_segments"]))
+
+    sessions = []
+    for path in sorted(glob.glob(os.path.join(args.data, "*.csv"))):
+        classes = session_classes(path)
+        if classes is None:
+            print(f"{os.path.basename(path):28s} skipped (no _class_<K> in the name)")
+            continue
+        rows = load_csv_rows(path)
+        frames, probs, (scores, gate_scores) = score_session(rows, summ, plan, backend, [motion, gate])
+        sessions.append({"file": os.path.basename(path), "classes": [c for c in classes if c != 0],
+                         "times": frames / args.frame_hz, "probs": probs, "scores": scores,
+                         "gate_scores": gate_scores, "minutes": len(rows) / args.frame_hz / 60.0})
+
+    threshold = args.motion_threshold
+    if threshold is None:
+        idle = [s["scores"] for s in sessions if not s["classes"] and len(s["scores"])]
+        threshold = float(np.percentile(np.concatenate(idle), 99)) if idle else 0.0
+    for s in sessions:
+        s["episodes"] = (find_episodes(s["times"], s["scores"], threshold, args.merge, args.min_episode)
+                         if s["classes"] else [])
+        names = ",".join(class_names[c] for c in s["classes"]) or class_names[0]
+        print(f"{s['file']:28s} classes={names:12s} windows={len(s['times']):6d}  episodes={len(s['episodes'])}")
+    print(f"Motion threshold {threshold:.3f}, {sum(len(s['episodes']) for s in sessions)} episodes in "
+          f"{sum(s['minutes'] for s in sessions):.1f} min")
+
+    if args.configs:
+        with open(args.configs, "r") as f:
+            configs = json.load(f)
+    else:
+        configs = DEFAULT_CONFIGS
+
+    results = []
+    for cfg in configs:
+        cfg = dict(cfg)
+        name = cfg.pop("name", None)
+        engine = make_decision_engine(cfg, class_names, args.refractory, 1.0 / args.frame_hz)
+        res = evaluate(engine, sessions, grace, args.gate)
+        res["name"] = name or json.dumps(cfg, separators=(",", ":"))
+        res["config"] = engine.describe()
+        results.append(res)
+
+    # a config is on the front when no other is at least as good on all of
+    # false rate, delay and hit rate
+    for r in results:
+        r["pareto"] = not any(
+            o is not r and o["false_per_min"] <= r["false_per_min"] and o["delay_p50_s"] <= r["delay_p50_s"]
+            and o["hit_rate"] >= r["hit_rate"] and (o["false_per_min"], o["delay_p50_s"], -o["hit_rate"])
+            != (r["false_per_min"], r["delay_p50_s"], -r["hit_rate"])
+            for o in results)
+
+    print(f"\n{'config':48s} {'hit':>6s} {'delay50':>8s} {'delay90':>8s} {'false':>6s} {'false/min':>10s} "
+          f"{'none/wrong/outside':>19s}")
+    for r in results:
+        kinds = "/".join(str(v) for v in r["false_by_kind"].values())
+        print(f"{r['name'][:48]:48s} {r['hit_rate'] * 100:5.1f}% {r['delay_p50_s']:8.2f} {r['delay_p90_s']:8.2f} "
+              f"{r['false_triggers']:6d} {r['false_per_min']:10.2f} {kinds:>19s} {'*' if r['pareto'] else ''}")
+    print("* = not beaten on hit rate, delay and false triggers by any other config")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"motion_threshold": threshold, "grace_s": grace, "gate": args.gate,
+                       "sessions": [{"file": s["file"], "classes": s["classes"], "episodes": s["episodes"]}
+                                    for s in sessions],
+                       "results": results}, f, indent=2)
+        print("Saved:", args.json)
+
+
+if __name__ == "__main__":
+    main()
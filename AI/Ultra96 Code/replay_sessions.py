@@ -0,0 +1,232 @@
+import argparse
+import csv
+import glob
+import json
+import os
+import threading
+import time
+from datetime import datetime
+import numpy as np
+
+from cnn_runner_final import Ultra96CNNRunner, Ultra96MQTTSubscriber, NumpyCNNBackend, StageProfiler
+
+
+# Replays recorded ultra96_csv_logger sessions through the real
+# Ultra96MQTTSubscriber worker path: frames are packed into the same
+# 4-frame big-endian packets the bridge publishes and handed to on_message
+# through an in-process client instead of a broker.
+#
+# Latency is measured from handing a packet to on_message until the worker is
+# done with it. Window latency has one sample per decided window (the windows
+# a packet completes finish with it); window cost is packet latency divided by
+# the windows decided in that packet.
+
+FRAMES_PER_PACKET = 4
+
+
+class _Message:
+    def __init__(self, topic, payload):
+        self.topic = topic
+        self.payload = payload
+
+
+class LoopbackClient:
+    """Stands in for paho.mqtt.Client; keeps what the subscriber publishes"""
+    def __init__(self):
+        self.published = []
+        self._lock = threading.Lock()
+
+    def publish(self, topic, payload=None, qos=0):
+        with self._lock:
+            self.published.append((time.perf_counter(), topic, payload))
+
+    def subscribe(self, topic, qos=0):
+        pass
+
+
+def load_session(path):
+    """Returns (t_seconds[N], rows[N,30] float32) from a logger CSV"""
+    ts, rows = [], []
+    with open(path, "r", newline="") as f:
+        reader = csv.reader(f)
+        next(reader)
+        for rec in reader:
+            ts.append(datetime.fromisoformat(rec[0]).timestamp())
+            rows.append([float(v) for v in rec[1:31]])
+    t = np.asarray(ts, dtype=np.float64)
+    return t - t[0] if len(t) else t, np.asarray(rows, dtype=np.float32)
+
+
+def pack_frames(rows):
+    return np.ascontiguousarray(rows, dtype=">f4").tobytes()
+
+
+class ReplayHarness:
+    def __init__(self, subscriber, max_inflight=1):
+        self.sub = subscriber
+        self.sub.on_packet_done = self._on_done
+        self.max_inflight = max_inflight
+        self._slots = threading.Semaphore(max_inflight)
+        self._cond = threading.Condition()
+        self._sent_at = {}
+        self._last_done = None
+        self.latencies_ms = []
+        self.window_latencies_ms = []
+        self.window_cost_ms = []
+        self.frames = 0
+        self.packets_dropped = 0
+
+    def _on_done(self, sess, results):
+        now = time.perf_counter()
+        with self._cond:
+            # packets coalesced into this one finished with it
+            for s in sorted(s for s in self._sent_at if s <= sess):
+                t0, held_slot = self._sent_at.pop(s)
+                if s == sess:
+                    ms = (now - t0) * 1000
+                    windows = sum(1 for pred, _ in results if pred is not None)
+                    self.latencies_ms.append(ms)
+                    self.window_latencies_ms += [ms] * windows
+                    if windows:
+                        self.window_cost_ms.append(ms / windows)
+                if held_slot:
+                    self._slots.release()
+            self._last_done = sess
+            self._cond.notify_all()
+
+    def _wait_idle(self, sess):
+        with self._cond:
+            while self._last_done is None or self._last_done < sess:
+                self._cond.wait()
+
+    def replay(self, t, rows, speed=None):
+        """speed=None replays as fast as possible, otherwise at speed x recorded timing"""
+        self.sub.ai.reset()
+        n_packets = len(rows) // FRAMES_PER_PACKET
+        start = time.perf_counter()
+        waiting_for = None
+        for i in range(n_packets):
+            chunk = rows[i * FRAMES_PER_PACKET:(i + 1) * FRAMES_PER_PACKET]
+            if speed is None:
+                held_slot = self._slots.acquire()
+            else:
+                due = start + t[(i + 1) * FRAMES_PER_PACKET - 1] / speed
+                delay = due - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                held_slot = False
+
+            sess = self.sub.session_counter
+            with self._cond:
+                self._sent_at[sess] = (time.perf_counter(), held_slot)
+            dropped_before = self.sub.frames_dropped
+            self.sub.on_message(self.sub.client, None,
+                                _Message(self.sub.topic_sensor_to_ultra96, pack_frames(chunk)))
+            # Ingest queue full: the packet never reaches the worker, so no
+            # on_packet_done will come for it
+            if self.sub.frames_dropped != dropped_before:
+                self.packets_dropped += 1
+                with self._cond:
+                    self._sent_at.pop(sess)
+                if held_slot:
+                    self._slots.release()
+            else:
+                self.frames += len(chunk)
+                waiting_for = sess
+        if waiting_for is not None:
+            self._wait_idle(waiting_for)
+        return n_packets
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("csv", nargs="*", help="logger CSVs (default: all in --data)")
+    ap.add_argument("--data", default="raw_data_from_ultra96")
+    ap.add_argument("--artifacts", default="artifacts_tf", help="directory with meta.json, npz and HLS_PARAMS")
+    ap.add_argument("--backend", choices=["cpu", "pynq"], default="cpu")
+    ap.add_argument("--bitfile", default="cnn_overlay_11.xsa")
+    ap.add_argument("--speed", type=float, default=None,
+                    help="replay at this multiple of recorded timing (default: as fast as possible)")
+    ap.add_argument("--max-inflight", type=int, default=1,
+                    help="packets in flight when replaying as fast as possible")
+    ap.add_argument("--hop", type=int, default=None)
+    ap.add_argument("--profile", action="store_true", help="print per-stage timing histograms")
+    ap.add_argument("--trace", default=None, help="write a Chrome trace JSON here (implies --profile)")
+    ap.add_argument("--json", default=None, help="write the report to this file")
+    args = ap.parse_args()
+
+    paths = args.csv or sorted(glob.glob(os.path.join(args.data, "*.csv")))
+    backend = None
+    if args.backend == "cpu":
+        backend = NumpyCNNBackend.from_hls_params(os.path.join(args.artifacts, "HLS_PARAMS"))
+    ai = Ultra96CNNRunner(
+        bitfile=args.bitfile,
+        meta_path=os.path.join(args.artifacts, "meta.json"),
+        pca_npz=os.path.join(args.artifacts, "pca_params_summarizer.npz"),
+        backend=backend,
+        hop=args.hop,
+        profiler=StageProfiler(args.trace) if (args.profile or args.trace) else None,
+    )
+    client = LoopbackClient()
+    sub = Ultra96MQTTSubscriber(ai, client=client)
+    harness = ReplayHarness(sub, args.max_inflight)
+
+    events = []
+    start = time.perf_counter()
+    for path in paths:
+        t, rows = load_session(path)
+        first_event = len(client.published)
+        dropped_before = harness.packets_dropped
+        harness.replay(t, rows, args.speed)
+        for _, _, payload in client.published[first_event:]:
+            pred = json.loads(payload)["prediction"]
+            events.append({"file": os.path.basename(path), "prediction": pred,
+                           "class": ai.class_names[pred]})
+        n_events = len(client.published) - first_event
+        dropped = harness.packets_dropped - dropped_before
+        print(f"{os.path.basename(path):28s} frames={len(rows):6d}  events={n_events}"
+              + (f"  dropped_packets={dropped}" if dropped else ""))
+    elapsed = time.perf_counter() - start
+
+    def percentiles(ms):
+        ms = np.asarray(ms) if ms else np.zeros(1)
+        return {p: float(np.percentile(ms, q)) for p, q in
+                (("p50", 50), ("p95", 95), ("p99", 99), ("max", 100))}
+
+    fps = harness.frames / elapsed if elapsed > 0 else 0.0
+    report = {
+        "backend": ai.backend_name,
+        "frames": harness.frames,
+        "seconds": elapsed,
+        "frames_per_s": fps,
+        "gloves_at_50hz": fps / 50.0,
+        "windows": len(harness.window_latencies_ms),
+        "window_latency_ms": percentiles(harness.window_latencies_ms),
+        "window_cost_ms": percentiles(harness.window_cost_ms),
+        "packet_latency_ms": percentiles(harness.latencies_ms),
+        "frames_dropped": sub.frames_dropped,
+        "packets_dropped": harness.packets_dropped,
+        "inferences_skipped": sub.inferences_skipped,
+        "events": events,
+    }
+    if ai.profiler:
+        report["stages"] = ai.profiler.summary()
+
+    print(f"\n{harness.frames} frames in {elapsed:.2f} s → {fps:.0f} frames/s "
+          f"(~{fps / 50.0:.1f} gloves at 50 Hz)")
+    for key, label in (("window_latency_ms", "Window latency"), ("window_cost_ms", "Window cost"),
+                       ("packet_latency_ms", "Packet latency")):
+        print(f"{label + ' ms:':20s}" + "  ".join(f"{k}={v:.2f}" for k, v in report[key].items()))
+    print(f"Dropped frames: {sub.frames_dropped} ({harness.packets_dropped} packets)  "
+          f"skipped inferences: {sub.inferences_skipped}  "
+          f"events: {len(events)}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+        print("Saved:", args.json)
+    ai.close()
+
+
+if __name__ == "__main__":
+    main()
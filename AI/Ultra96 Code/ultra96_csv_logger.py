@@ -1,7 +1,6 @@
 import paho.mqtt.client as mqtt
 import json
 import time
-import struct
 from datetime import datetime
 import ssl
 import csv
@@ -10,6 +9,9 @@ import threading
 import sys
 import termios
 import tty
+import argparse
+import numpy as np
+from queue import Queue
 
 CSV_FILE = "sijia_class_6.csv"
 
@@ -24,6 +26,125 @@ for imu_id in range(5):
 capture_buffer = []
 is_capturing = False
 
+# binary capture mode (--binary DIR): frames stream to disk instead of RAM
+BINARY_DIR = None
+capture_writer = None
+
+# Sensor packets are a whole number of 120-byte frames, optionally followed by
+# the bridge's 16-byte latency trace trailer (b"TRC1" | seq | ingress ns).
+FRAME_BYTES = 120
+TRACE_MAGIC = b"TRC1"
+TRACE_SIZE = 16
+
+
+def strip_trace(payload):
+    if len(payload) % FRAME_BYTES == TRACE_SIZE and payload[-TRACE_SIZE:-TRACE_SIZE + 4] == TRACE_MAGIC:
+        return payload[:-TRACE_SIZE]
+    return payload
+
+
+# Columnar binary capture. The MQTT callback only enqueues the raw payload and
+# a monotonic-ns stamp; a background thread decodes into fixed-size chunks and
+# writes each full chunk as <seg>_frames.npy (float32, N x 30) and <seg>_t.npy
+# (int64 monotonic ns), listed in index.json. Memory stays constant. Each
+# segment entry carries the wall/monotonic reference pair of the writer that
+# made it, since the monotonic clock restarts at reboot.
+class BinaryCaptureWriter:
+    def __init__(self, out_dir, chunk_frames=4096):
+        self.out_dir = out_dir
+        os.makedirs(out_dir, exist_ok=True)
+        self.chunk_frames = chunk_frames
+        self._frames = np.zeros((chunk_frames, 30), dtype=np.float32)
+        self._t = np.zeros(chunk_frames, dtype=np.int64)
+        self._n = 0
+        self.total_frames = 0
+
+        # wall/monotonic reference pair so the converter can rebuild timestamps
+        self.wall_ref_ns = time.time_ns()
+        self.mono_ref_ns = time.monotonic_ns()
+
+        self._index_path = os.path.join(out_dir, "index.json")
+        if os.path.exists(self._index_path):
+            with open(self._index_path, "r") as f:
+                self._index = json.load(f)
+        else:
+            self._index = {"columns": header[1:], "segments": []}
+
+        self._queue = Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, payload):
+        self._queue.put((payload, time.monotonic_ns()))
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                self._flush()
+                return
+            payload, t_ns = item
+            payload = strip_trace(payload)
+            if len(payload) % FRAME_BYTES != 0:
+                print(f"[WARN] Bad payload size: {len(payload)}")
+                continue
+            rows = np.frombuffer(payload, dtype=">f4").reshape(-1, 30)
+            # all frames of one packet share its arrival stamp
+            for row in rows:
+                self._frames[self._n] = row
+                self._t[self._n] = t_ns
+                self._n += 1
+                if self._n == self.chunk_frames:
+                    self._flush()
+
+    def _flush(self):
+        if self._n == 0:
+            return
+        seg = f"seg_{len(self._index['segments']):05d}"
+        np.save(os.path.join(self.out_dir, seg + "_frames.npy"), self._frames[:self._n])
+        np.save(os.path.join(self.out_dir, seg + "_t.npy"), self._t[:self._n])
+        self._index["segments"].append({"name": seg, "frames": self._n,
+                                        "wall_ref_ns": self.wall_ref_ns, "mono_ref_ns": self.mono_ref_ns})
+        with open(self._index_path, "w") as f:
+            json.dump(self._index, f, indent=2)
+        self.total_frames += self._n
+        self._n = 0
+
+
+def load_capture(capture_dir):
+    """Memory-map a binary capture: yields (frames[N,30], t_ns[N]) per segment"""
+    with open(os.path.join(capture_dir, "index.json"), "r") as f:
+        index = json.load(f)
+    for seg in index["segments"]:
+        yield (np.load(os.path.join(capture_dir, seg["name"] + "_frames.npy"), mmap_mode="r"),
+               np.load(os.path.join(capture_dir, seg["name"] + "_t.npy"), mmap_mode="r"))
+
+
+def convert_capture_to_csv(capture_dir, csv_path):
+    """Write a binary capture out in the CSV layout used by write_csv"""
+    with open(os.path.join(capture_dir, "index.json"), "r") as f:
+        index = json.load(f)
+
+    new_file = not os.path.exists(csv_path)
+    count = 0
+    with open(csv_path, "a", newline="") as f:
+        writer = csv.writer(f)
+        if new_file:
+            writer.writerow(header)
+        for seg, (frames, t_ns) in zip(index["segments"], load_capture(capture_dir)):
+            # older captures keep a single reference pair at the top of the index
+            ref = seg if "wall_ref_ns" in seg else index
+            offset_ns = ref["wall_ref_ns"] - ref["mono_ref_ns"]
+            for row, t in zip(frames, t_ns):
+                ts = datetime.fromtimestamp((int(t) + offset_ns) / 1e9).isoformat()
+                writer.writerow([ts] + [f"{v:.6f}" for v in row])
+                count += 1
+    return count
+
 
 def getch():
     """Read one character without pressing enter"""
@@ -36,7 +157,7 @@ def getch():
         termios.tcsetattr(fd, termios.TCSADRAIN, old)
 
 def keyboard_listener():
-    global is_capturing, capture_buffer
+    global is_capturing, capture_buffer, capture_writer
 
     print("\n======= KEYBOARD CONTROL =======")
     print("Press  q   start capturing IMU data")
@@ -54,15 +175,26 @@ def keyboard_listener():
             ch = sys.stdin.read(1)
 
             if ch.lower() == 'q':
-                is_capturing = True
                 capture_buffer = []
+                if BINARY_DIR:
+                    # A capture already running is flushed first, so its frames and
+                    # index entries are on disk before the new writer reads the index.
+                    # Capturing is off in between, so nothing lands in the RAM buffer.
+                    is_capturing = False
+                    close_capture_writer()
+                    capture_writer = BinaryCaptureWriter(BINARY_DIR)
+                is_capturing = True
                 print("\n✅ CAPTURE STARTED (press z to stop)\n")
 
             elif ch.lower() == 'z':
                 is_capturing = False
-                print("\nSTOPPED — writing CSV...\n")
-                write_csv()
-                print(f"Saved {len(capture_buffer)} samples → {CSV_FILE}\n")
+                if capture_writer:
+                    print("\nSTOPPED — flushing binary capture...")
+                    close_capture_writer()
+                else:
+                    print("\nSTOPPED — writing CSV...\n")
+                    write_csv()
+                    print(f"Saved {len(capture_buffer)} samples → {CSV_FILE}\n")
 
             elif ch.lower() == 'x':
                 print("\nEXITING PROGRAM...\n")
@@ -70,9 +202,18 @@ def keyboard_listener():
 
     finally:
         termios.tcsetattr(fd, termios.TCSADRAIN, old_settings)
+        close_capture_writer()
         os._exit(0)
 
 
+def close_capture_writer():
+    global capture_writer
+    writer, capture_writer = capture_writer, None
+    if writer:
+        writer.close()
+        print(f"\nSaved {writer.total_frames} samples → {BINARY_DIR}\n")
+
+
 
 def write_csv():
     new_file = not os.path.exists(CSV_FILE)
@@ -117,29 +258,25 @@ class Ultra96CSVLogger:
 
     @staticmethod
     def parse_frames(raw_data):
-        if len(raw_data) % 24 != 0:
+        raw_data = strip_trace(raw_data)
+        if not raw_data or len(raw_data) % FRAME_BYTES != 0:
             print(f"[WARN] Bad payload size: {len(raw_data)}")
             return []
-
-        frames = []
-        offset = 0
-        total_imus = len(raw_data) // 24
-        num_frames = total_imus // 5
-
-        for _ in range(num_frames):
-            frame = []
-            for _ in range(5):
-                imu_values = struct.unpack("!6f", raw_data[offset:offset + 24])
-                offset += 24
-                frame.append(imu_values)
-            frames.append(frame)
-
-        return frames
+        # any whole number of frames; each frame is 5 IMUs x 6 big-endian floats
+        return np.frombuffer(raw_data, dtype=">f4").reshape(-1, 5, 6).tolist()
 
     def on_message(self, client, userdata, msg):
         global is_capturing, capture_buffer
 
         raw_data = msg.payload
+
+        # binary mode never falls back to the RAM buffer
+        if BINARY_DIR:
+            writer = capture_writer
+            if is_capturing and writer:
+                writer.submit(raw_data)
+            return
+
         frames = self.parse_frames(raw_data)
 
         if not frames:
@@ -167,6 +304,19 @@ class Ultra96CSVLogger:
 
 # MAIN
 if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--binary", metavar="DIR", default=None,
+                    help="capture to chunked .npy files in DIR instead of buffering CSV rows in RAM")
+    ap.add_argument("--convert", nargs=2, metavar=("DIR", "CSV"), default=None,
+                    help="convert a binary capture DIR to CSV and exit")
+    args = ap.parse_args()
+
+    if args.convert:
+        n = convert_capture_to_csv(*args.convert)
+        print(f"Converted {n} samples → {args.convert[1]}")
+        sys.exit(0)
+    BINARY_DIR = args.binary
+
     print("="*60)
     print(" Ultra96 — CSV Data Capture (Press Q to start, Z to save)")
     print("="*60)
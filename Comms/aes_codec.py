@@ -0,0 +1,160 @@
+import argparse
+import base64
+import binascii
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from Crypto.Cipher import AES
+
+# Shared AES-128-CBC codec for the comms bridges.
+#
+# The key schedule is expanded once into an ECB cipher object and reused for
+# every message (AES.new per message costs more than the decryption itself).
+# CBC decryption of many messages is done in one pass: every ciphertext
+# block of the batch goes through a single ECB decrypt call, then the whole
+# batch is XORed with the "previous block" stream (IV + ciphertext shifted by
+# one block, per message). Encryption is inherently sequential per message
+# and reuses the same key schedule block by block.
+
+BLOCK = 16
+
+
+def _xor(a, b):
+    return (int.from_bytes(a, "big") ^ int.from_bytes(b, "big")).to_bytes(len(a), "big")
+
+
+def _unpad(data):
+    """PKCS7; returns None when the padding is invalid"""
+    n = data[-1] if data else 0
+    if not 1 <= n <= BLOCK or data[-n:] != bytes([n]) * n:
+        return None
+    return data[:-n]
+
+
+def b64decode_lenient(b64):
+    """Base64 decode that tolerates missing '=' padding (as the firmware sometimes sends)"""
+    b64 = b64.strip()
+    if isinstance(b64, str):
+        b64 = b64.encode("utf-8")
+    if len(b64) % 4:
+        b64 += b"=" * (-len(b64) % 4)
+    try:
+        return binascii.a2b_base64(b64)
+    except binascii.Error:
+        return None
+
+
+class AesCbcCodec:
+    """AES-CBC with a precomputed key schedule, batch decryption and throughput counters"""
+    def __init__(self, key, iv):
+        self.key = bytes(key)
+        self.iv = bytes(iv)
+        self._ecb = AES.new(self.key, AES.MODE_ECB)
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    def reset_stats(self):
+        with self._lock:
+            self.messages = 0
+            self.bytes = 0
+            self.failed = 0
+            self.busy_ns = 0
+
+    def encrypt(self, plaintext, pad=True):
+        """CBC-encrypt one message; pad=False expects a whole number of blocks"""
+        if pad:
+            n = BLOCK - len(plaintext) % BLOCK
+            plaintext = plaintext + bytes([n]) * n
+        out = []
+        prev = self.iv
+        for off in range(0, len(plaintext), BLOCK):
+            prev = self._ecb.encrypt(_xor(plaintext[off:off + BLOCK], prev))
+            out.append(prev)
+        return b"".join(out)
+
+    def encrypt_b64(self, plaintext):
+        return base64.b64encode(self.encrypt(plaintext)).decode("utf-8")
+
+    def decrypt_many(self, ciphertexts, unpad=True):
+        """CBC-decrypt a batch of messages in one pass; invalid messages come back as None"""
+        t0 = time.perf_counter_ns()
+        valid = [i for i, ct in enumerate(ciphertexts) if ct and len(ct) % BLOCK == 0]
+        results = [None] * len(ciphertexts)
+        if valid:
+            cts = [ciphertexts[i] for i in valid]
+            blob = b"".join(cts)
+            prev = b"".join(self.iv + ct[:-BLOCK] for ct in cts)
+            plain = _xor(self._ecb.decrypt(blob), prev)
+            off = 0
+            for i, ct in zip(valid, cts):
+                msg = plain[off:off + len(ct)]
+                off += len(ct)
+                results[i] = _unpad(msg) if unpad else msg
+        failed = sum(r is None for r in results)
+        with self._lock:
+            self.messages += len(ciphertexts)
+            self.bytes += sum(len(ct) for ct in ciphertexts if ct)
+            self.failed += failed
+            self.busy_ns += time.perf_counter_ns() - t0
+        return results
+
+    def decrypt(self, ciphertext, unpad=True):
+        return self.decrypt_many([ciphertext], unpad)[0]
+
+    def decrypt_b64_many(self, lines):
+        """Base64 lines -> plaintext bytes (None where decoding or decryption fails)"""
+        return self.decrypt_many([b64decode_lenient(line) for line in lines])
+
+    def report(self, reset=False):
+        """Throughput of the time actually spent decrypting (per worker-second)"""
+        with self._lock:
+            busy_s = self.busy_ns / 1e9
+            rep = {
+                "messages": self.messages,
+                "failed": self.failed,
+                "bytes": self.bytes,
+                "messages_per_s": self.messages / busy_s if busy_s else 0.0,
+                "mb_per_s": self.bytes / busy_s / 1e6 if busy_s else 0.0,
+            }
+        if reset:
+            self.reset_stats()
+        return rep
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Decrypt throughput benchmark for sizing bridge hosts")
+    ap.add_argument("--messages", type=int, default=20000)
+    ap.add_argument("--batch", type=int, default=8, help="messages per decrypt call (lines per TCP read)")
+    ap.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    ap.add_argument("--message-bytes", type=int, default=916,
+                    help="plaintext size; 916 is about a 4-set text line with battery")
+    ap.add_argument("--glove-msgs-per-s", type=float, default=12.5,
+                    help="messages per glove per second (50 Hz frames, 4 per message)")
+    args = ap.parse_args()
+
+    codec = AesCbcCodec(os.urandom(16), os.urandom(16))
+    line = codec.encrypt_b64(os.urandom(args.message_bytes)).encode("utf-8")
+    batches = [[line] * args.batch for _ in range(max(1, args.messages // args.batch))]
+    total = len(batches) * args.batch
+
+    # Reference: a new cipher object per message, as the bridges used to do
+    t0 = time.perf_counter()
+    for batch in batches:
+        for ln in batch:
+            AES.new(codec.key, AES.MODE_CBC, codec.iv).decrypt(base64.b64decode(ln))
+    per_msg = total / (time.perf_counter() - t0)
+    print(f"AES.new per message       {per_msg:10.0f} msg/s  (~{per_msg / args.glove_msgs_per_s:.0f} gloves)")
+
+    for workers in args.workers:
+        codec.reset_stats()
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(codec.decrypt_b64_many, batches))
+        rate = total / (time.perf_counter() - t0)
+        print(f"batched, {workers} worker(s)     {rate:10.0f} msg/s  (~{rate / args.glove_msgs_per_s:.0f} gloves)  "
+              f"{codec.report()['mb_per_s']:.1f} MB/s per worker")
+
+
+if __name__ == "__main__":
+    main()
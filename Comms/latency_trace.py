@@ -0,0 +1,104 @@
+import argparse
+import json
+import struct
+import threading
+import time
+from collections import defaultdict
+
+# End-to-end latency tracing: glove TCP ingress -> Ultra96 -> robot/Unity egress.
+#
+# moreonfb.py appends a 16-byte trailer to each sensor packet:
+#   magic b"TRC1" | seq (uint32) | ingress time.monotonic_ns() (uint64), big-endian
+# The runner (Ultra96MQTTSubscriber.split_trace) and the CSV logger
+# (strip_trace) remove it on the board (payload stays a multiple of 120
+# bytes, so untraced packets are unchanged). The runner echoes it in the
+# prediction JSON as
+#   "trace": {"seq": .., "ingress_ns": .., "runner_ms": ..}
+# where runner_ms is the time spent on the board. The egress bridges log one
+# JSON line per traced prediction; ingress and egress must run on the same
+# host so their monotonic clocks agree.
+
+TRACE_MAGIC = b"TRC1"
+TRACE_FMT = "!4sIQ"
+TRACE_SIZE = struct.calcsize(TRACE_FMT)
+
+
+def pack_trace(seq, ingress_ns):
+    return struct.pack(TRACE_FMT, TRACE_MAGIC, seq & 0xFFFFFFFF, ingress_ns)
+
+
+class TraceRecorder:
+    """Appends one JSON line per traced prediction reaching an egress point"""
+    def __init__(self, path, hop):
+        self.path = path
+        self.hop = hop
+        self._lock = threading.Lock()
+        self._file = open(path, "a", buffering=1)
+
+    def record(self, trace, egress_ns=None, hop=None):
+        if not trace or "ingress_ns" not in trace:
+            return
+        egress_ns = egress_ns if egress_ns is not None else time.monotonic_ns()
+        line = json.dumps({
+            "hop": hop or self.hop,
+            "seq": trace.get("seq"),
+            "ingress_ns": trace["ingress_ns"],
+            "egress_ns": egress_ns,
+            "runner_ms": trace.get("runner_ms"),
+        })
+        with self._lock:
+            self._file.write(line + "\n")
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+def _percentiles(values):
+    values = sorted(values)
+    if not values:
+        return {}
+    pick = lambda q: values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+    return {"n": len(values), "p50": pick(0.50), "p90": pick(0.90), "p99": pick(0.99), "max": values[-1]}
+
+
+def aggregate(paths):
+    """Per egress hop: total (ingress->egress), runner (on board) and transport (rest) in ms"""
+    hops = defaultdict(lambda: defaultdict(list))
+    for path in paths:
+        with open(path, "r") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                rec = json.loads(line)
+                total = (rec["egress_ns"] - rec["ingress_ns"]) / 1e6
+                h = hops[rec["hop"]]
+                h["total_ms"].append(total)
+                if rec.get("runner_ms") is not None:
+                    h["runner_ms"].append(rec["runner_ms"])
+                    h["transport_ms"].append(total - rec["runner_ms"])
+    return {hop: {k: _percentiles(v) for k, v in parts.items()} for hop, parts in hops.items()}
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Aggregate latency trace logs into per-hop percentiles")
+    ap.add_argument("logs", nargs="+")
+    ap.add_argument("--json", default=None, help="write the summary to this file")
+    args = ap.parse_args()
+
+    summary = aggregate(args.logs)
+    for hop, parts in summary.items():
+        print(f"== {hop}")
+        for name, p in parts.items():
+            print(f"   {name:13s} n={p['n']:6d}  p50={p['p50']:8.2f}  p90={p['p90']:8.2f}  "
+                  f"p99={p['p99']:8.2f}  max={p['max']:8.2f}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(summary, f, indent=2)
+        print("Saved:", args.json)
+
+
+if __name__ == "__main__":
+    main()
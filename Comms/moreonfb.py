@@ -2,15 +2,325 @@ import socket
 import json
 import struct
 import time
-from threading import Thread, Lock
+import argparse
+import asyncio
+import itertools
+from collections import deque
+from threading import Thread, Lock, Condition
+from concurrent.futures import ThreadPoolExecutor
 import paho.mqtt.client as mqtt
 import ssl
-import base64
-from Crypto.Cipher import AES
-from Crypto.Util.Padding import pad, unpad
+from aes_codec import AesCbcCodec, b64decode_lenient
+from latency_trace import TraceRecorder, pack_trace, _percentiles
+
+IMU_LABELS = ["IMU0", "IMU1", "IMU2", "IMU3", "IMU4"]
+IMU_SET_STRUCT = struct.Struct('!30f')
+
+# Binary IMU protocol v2, auto-detected per connection by its first byte
+# (text firmware always starts with a base64 character):
+#   wire:      b"\xA5\x02" | ciphertext length (uint16) | AES-128-CBC ciphertext (PKCS7, same key/IV)
+#   plaintext: format (uint8: 0 float32, 1 int16) | sets (uint8) | battery mV (uint16, 0 = none)
+#              | battery % (uint8) | sets x 30 big-endian values, IMU0..IMU4 x ax,ay,az,gx,gy,gz
+# float32 sets are already in the MQTT layout and are forwarded as-is; int16 values are
+# raw MPU6050 counts, scaled like fbglove.ino (accel / 16384 -> g, gyro / 131 -> deg/s).
+V2_MAGIC = b"\xA5\x02"
+V2_HEADER = struct.Struct("!2sH")
+V2_PAYLOAD_HEADER = struct.Struct("!BBHB")
+V2_FORMAT_FLOAT32 = 0
+V2_FORMAT_INT16 = 1
+V2_MAX_CIPHERTEXT = 4096
+IMU_SET_INT16_STRUCT = struct.Struct('!30h')
+INT16_SCALES = [16384.0] * 3 + [131.0] * 3
+
+
+class LineFramer:
+    """Splits a TCP byte stream into newline-terminated messages, all complete lines per feed"""
+    def __init__(self, max_pending=65536):
+        self._buf = bytearray()
+        self.max_pending = max_pending
+
+    def feed(self, data):
+        buf = self._buf
+        start = len(buf)
+        buf += data
+        # Earlier bytes were already searched, so only the new data can hold a newline
+        end = buf.rfind(b'\n', start)
+        if end < 0:
+            if len(buf) > self.max_pending:
+                print(f"Dropping {len(buf)} bytes without a newline")
+                buf.clear()
+            return []
+        with memoryview(buf) as view:
+            lines = view[:end].tobytes().split(b'\n')
+        del buf[:end + 1]
+        return lines
+
+
+class BinaryFramer:
+    """Splits a TCP byte stream into protocol v2 ciphertexts, all complete frames per feed"""
+    def __init__(self):
+        self._buf = bytearray()
+        self.resyncs = 0
+
+    def feed(self, data):
+        buf = self._buf
+        buf += data
+        frames = []
+        off = 0
+        with memoryview(buf) as view:
+            while len(buf) - off >= V2_HEADER.size:
+                magic, length = V2_HEADER.unpack_from(buf, off)
+                if magic != V2_MAGIC or length == 0 or length % 16 or length > V2_MAX_CIPHERTEXT:
+                    # Lost sync: skip to the next magic
+                    nxt = buf.find(V2_MAGIC, off + 1)
+                    off = nxt if nxt >= 0 else len(buf) - 1
+                    self.resyncs += 1
+                    continue
+                end = off + V2_HEADER.size + length
+                if end > len(buf):
+                    break
+                frames.append(view[off + V2_HEADER.size:end].tobytes())
+                off = end
+        del buf[:off]
+        return frames
+
+
+class FrameCoalescer:
+    """Packs each glove's IMU frames into MQTT packets of `frames` frames, flushing
+    whatever is buffered once its oldest frame has waited `max_delay_s`"""
+    def __init__(self, publish, frames=0, max_delay_s=None):
+        self.publish = publish  # publish(imu_bytes, oldest_ingress_ns)
+        self.frame_bytes = IMU_SET_STRUCT.size
+        self.frames = frames
+        self.max_delay_ns = int(max_delay_s * 1e9) if max_delay_s else None
+        self._cond = Condition()
+        self._pending = {}  # addr -> (bytearray of frames, deque of [ingress_ns, frames])
+        if self.max_delay_ns:
+            Thread(target=self._deadline_loop, daemon=True).start()
+
+    def add(self, addr, imu_bytes, t_ingress):
+        # Publishing under the lock keeps each glove's packets in order when the
+        # deadline thread and the reader flush at the same time
+        with self._cond:
+            buf, stamps = self._pending.setdefault(addr, (bytearray(), deque()))
+            buf += imu_bytes
+            stamps.append([t_ingress, len(imu_bytes) // self.frame_bytes])
+            while self.frames and len(buf) >= self.frames * self.frame_bytes:
+                self._emit(addr, self.frames)
+            self._cond.notify()
+
+    def flush(self, addr=None):
+        with self._cond:
+            for key in ([addr] if addr is not None else list(self._pending)):
+                if key in self._pending:
+                    self._emit(key, None)
+                    del self._pending[key]
+
+    def _emit(self, addr, frames):
+        buf, stamps = self._pending[addr]
+        n = len(buf) // self.frame_bytes if frames is None else frames
+        if n == 0:
+            return
+        t_oldest = stamps[0][0]
+        left = n
+        while left:
+            take = min(left, stamps[0][1])
+            stamps[0][1] -= take
+            left -= take
+            if stamps[0][1] == 0:
+                stamps.popleft()
+        packet = bytes(buf[:n * self.frame_bytes])
+        del buf[:n * self.frame_bytes]
+        self.publish(packet, t_oldest)
+
+    def _deadline_loop(self):
+        with self._cond:
+            while True:
+                now = time.monotonic_ns()
+                wait_ns = None
+                for addr, (buf, stamps) in self._pending.items():
+                    if not stamps:
+                        continue
+                    due = stamps[0][0] + self.max_delay_ns
+                    if due <= now:
+                        self._emit(addr, None)
+                    else:
+                        wait_ns = due - now if wait_ns is None else min(wait_ns, due - now)
+                self._cond.wait(None if wait_ns is None else wait_ns / 1e9)
+
+
+class CommandDispatcher:
+    """Delivers commands to one TCP destination from its own thread.
+
+    The queue is bounded and the newest command wins; the destination is
+    (re)connected in the background with exponential backoff, so a dead robot
+    never blocks the MQTT thread or the other robots."""
+    def __init__(self, ip, port, name="FireBeetle", queue_size=1, stale_s=2.0,
+                 connect_timeout=5.0, backoff_min=0.5, backoff_max=10.0, trace_recorder=None):
+        self.ip = ip
+        self.port = port
+        self.name = name
+        self.stale_ns = int(stale_s * 1e9)
+        self.connect_timeout = connect_timeout
+        self.backoff_min = backoff_min
+        self.backoff_max = backoff_max
+        self.trace_recorder = trace_recorder
+
+        self._cond = Condition()
+        self._queue = deque(maxlen=queue_size)  # (payload, enqueued_ns, label, trace)
+        self._sock = None
+        self._running = True
+
+        self.sent = 0
+        self.replaced = 0
+        self.stale = 0
+        self.failed = 0
+        self.connects = 0
+        self.latencies_ms = deque(maxlen=1024)
+
+        self._thread = Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    @property
+    def connected(self):
+        return self._sock is not None
+
+    def submit(self, payload, label=None, trace=None):
+        with self._cond:
+            if len(self._queue) == self._queue.maxlen:
+                self.replaced += 1
+            self._queue.append((payload, time.monotonic_ns(), label, trace))
+            self._cond.notify()
+
+    def close(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        self._thread.join(timeout=1.0)
+        self._drop_socket()
+
+    def _connect(self):
+        try:
+            s = socket.create_connection((self.ip, self.port), timeout=self.connect_timeout)
+            s.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            s.settimeout(self.connect_timeout)
+            self._sock = s
+            self.connects += 1
+            print(f"Connected to {self.name} at {self.ip}:{self.port}")
+            return True
+        except OSError as e:
+            print(f"Could not connect to {self.name} {self.ip}:{self.port} - {e}")
+            return False
+
+    def _drop_socket(self):
+        if self._sock:
+            try:
+                self._sock.close()
+            except OSError:
+                pass
+        self._sock = None
+
+    def _run(self):
+        backoff = self.backoff_min
+        while self._running:
+            if self._sock is None:
+                if not self._connect():
+                    with self._cond:
+                        self._cond.wait_for(lambda: not self._running, timeout=backoff)
+                    backoff = min(backoff * 2, self.backoff_max)
+                    continue
+                backoff = self.backoff_min
+
+            with self._cond:
+                self._cond.wait_for(lambda: self._queue or not self._running)
+                if not self._running:
+                    return
+                payload, enqueued_ns, label, trace = self._queue.popleft()
+
+            if time.monotonic_ns() - enqueued_ns > self.stale_ns:
+                self.stale += 1
+                continue
+            try:
+                self._sock.sendall(payload)
+            except OSError as e:
+                print(f"Failed to send to {self.name} {self.ip}: {e}")
+                self.failed += 1
+                self._drop_socket()
+                # Retry after reconnecting unless a newer command has arrived
+                with self._cond:
+                    if not self._queue:
+                        self._queue.append((payload, enqueued_ns, label, trace))
+                continue
+
+            egress_ns = time.monotonic_ns()
+            self.sent += 1
+            self.latencies_ms.append((egress_ns - enqueued_ns) / 1e6)
+            print(f"Sent {label or len(payload)} to {self.name} {self.ip}:{self.port}")
+            if self.trace_recorder and trace:
+                self.trace_recorder.record(trace, egress_ns)
+
+    def report(self):
+        lat = _percentiles(self.latencies_ms)
+        return {"connected": self.connected, "sent": self.sent, "replaced": self.replaced,
+                "stale": self.stale, "failed": self.failed, "connects": self.connects,
+                "send_ms_p50": lat.get("p50", 0.0), "send_ms_p99": lat.get("p99", 0.0),
+                "send_ms_max": lat.get("max", 0.0)}
+
+
+class TelemetryChannel:
+    """Side channel for slow telemetry (battery): keeps only the latest value and
+    sends it from its own thread on meaningful change (at most every min_gap_s)
+    or, while readings keep arriving, every interval_s"""
+    def __init__(self, send, changed, interval_s=5.0, min_gap_s=0.5):
+        self.send = send        # send(value); must not block for long
+        self.changed = changed  # changed(last_sent, new) -> bool
+        self.interval_s = interval_s
+        self.min_gap_s = min_gap_s
+        self._cond = Condition()
+        self._latest = None
+        self._fresh = False
+        self._last_sent = None
+        self._last_send_t = 0.0
+        self.updates = 0
+        self.sends = 0
+        Thread(target=self._run, daemon=True).start()
+
+    def update(self, value):
+        with self._cond:
+            self._latest = value
+            self._fresh = True
+            self.updates += 1
+            self._cond.notify()
+
+    def _due(self):
+        if not self._fresh:
+            return None
+        if self._last_sent is None or self.changed(self._last_sent, self._latest):
+            return self._last_send_t + self.min_gap_s
+        return self._last_send_t + self.interval_s
+
+    def _run(self):
+        with self._cond:
+            while True:
+                due = self._due()
+                now = time.monotonic()
+                if due is None or due > now:
+                    self._cond.wait(None if due is None else due - now)
+                    continue
+                value = self._latest
+                self._last_sent = value
+                self._last_send_t = now
+                self._fresh = False
+                self.sends += 1
+                try:
+                    self.send(value)
+                except Exception as e:
+                    print(f"Telemetry send failed: {e}")
+
 
 class FireBeetleMQTTPublisher:
-    def __init__(self):
+    def __init__(self, trace_log=None, coalesce_frames=0, coalesce_ms=None, qos_sensor=1, qos_commands=1,
+                 battery_interval_s=5.0):
         #IMU inbound
         self.TCP_IP = "0.0.0.0"
         self.TCP_PORT = 4210
@@ -22,6 +332,8 @@ class FireBeetleMQTTPublisher:
                               0xAB, 0xF7, 0x15, 0x88, 0x09, 0xCF, 0x4F, 0x3C])
         self.aes_iv = bytes([0x00, 0x01, 0x02, 0x03, 0x04, 0x05, 0x06, 0x07,
                              0x08, 0x09, 0x0A, 0x0B, 0x0C, 0x0D, 0x0E, 0x0F])
+        # Key schedule expanded once, shared by every connection and worker
+        self.codec = AesCbcCodec(self.aes_key, self.aes_iv)
 
         # XOR Key for movement commands
         self.xor_key = b"CG4002Robot2024!"  # 16-byte XOR key
@@ -34,100 +346,86 @@ class FireBeetleMQTTPublisher:
         # MQTT Topics
         self.topic_sensor_to_ultra96 = "robot/sensor/to_ultra96"
         self.topic_ultra96_to_sensor = "ultra96/processed/to_firebeetle"
+        self.QOS = {self.topic_sensor_to_ultra96: qos_sensor, self.topic_ultra96_to_sensor: qos_commands}
+
+        # Publish coalescing (opt-in): packets of N frames and/or a max-delay deadline.
+        # Off: one packet per TCP read.
+        self.coalescer = None
+        if coalesce_frames or coalesce_ms:
+            self.coalescer = FrameCoalescer(self._publish_packet, coalesce_frames,
+                                            (coalesce_ms if coalesce_ms is not None else 40.0) / 1000.0)
 
-        self.unity_socket = None
         self.UNITY_IP = "172.20.10.3"
         self.UNITY_PORT = 4211
+        self.unity_dispatcher = None
+
+        # Battery goes to Unity on a side channel, off the IMU path:
+        # latest value only, sent on change or every battery_interval_s
+        self.BATTERY_VOLT_DELTA = 0.02
+        self.BATTERY_PCT_DELTA = 1.0
+        self.battery = TelemetryChannel(self.send_battery_to_unity, self._battery_changed, battery_interval_s)
 
         self.mqtt_client = None
         
         self.imu_values = {}
 
         self.tcp_clients = set()
+        self.ingest_pool = None
 
         self.FIREBEETLE_CMD_IPS = ["172.20.10.4"]
         self.FIREBEETLE_CMD_PORT = 5001
-        self.command_sockets = {}
-        self.command_lock = Lock()
+        self.command_dispatchers = {}
 
-        self.connect_to_unity()
+        # End-to-end latency tracing (opt-in): stamp sensor packets, log egress
+        self.trace_recorder = TraceRecorder(trace_log, "firebeetle_cmd") if trace_log else None
+        self._trace_seq = itertools.count()
+
+        # Aggregated ingest reporting instead of per-line prints
+        self.REPORT_INTERVAL_S = 5.0
+        self.stats_lock = Lock()
+        self.stats = self._empty_stats()
+        self._last_report = time.monotonic()
 
     def connect_to_unity(self):
-        """Connect to Unity via TCP for battery data"""
-        try:
-            self.unity_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.unity_socket.connect((self.UNITY_IP, self.UNITY_PORT))
-            print(f"Connected to Unity at {self.UNITY_IP}:{self.UNITY_PORT}")
-        except Exception as e:
-            print(f"Failed to connect to Unity: {e}")
-            self.unity_socket = None
+        """Background connection to Unity for battery data (reconnects with backoff)"""
+        self.unity_dispatcher = CommandDispatcher(self.UNITY_IP, self.UNITY_PORT, name="Unity",
+                                                  stale_s=self.battery.interval_s)
 
     def encrypt_battery_data(self, voltage, percentage):
         """for Unity"""
         try:
             plaintext = f"VOLTAGE:{voltage:.3f},PERCENTAGE:{percentage:.0f}"
-            plaintext_bytes = plaintext.encode('utf-8')
-            padded_data = pad(plaintext_bytes, AES.block_size)
-            cipher = AES.new(self.aes_key, AES.MODE_CBC, self.aes_iv)
-            encrypted_data = cipher.encrypt(padded_data)
-            encrypted_b64 = base64.b64encode(encrypted_data).decode('utf-8')
-            return encrypted_b64
+            return self.codec.encrypt_b64(plaintext.encode('utf-8'))
         except Exception as e:
             print(f"Battery data encryption failed: {e}")
             return None
 
     def decrypt_data(self, encrypted_base64):
         """Decrypt AES-encrypted data."""
-        try:
-            if isinstance(encrypted_base64, str):
-                b64 = encrypted_base64.strip().encode("utf-8")
-            else:
-                b64 = encrypted_base64.strip()
-
-            # Decode base64
-            try:
-                encrypted_data = base64.b64decode(b64, validate=True)
-            except Exception:
-                try:
-                    padding = 4 - (len(b64) % 4)
-                    if padding != 4:
-                        b64 += b'=' * padding
-                    encrypted_data = base64.b64decode(b64)
-                except Exception as e:
-                    print(f"Base64 decode failed: {e}")
-                    return None
-
-            if len(encrypted_data) % 16 != 0:
-                print(f"Invalid ciphertext length: {len(encrypted_data)}")
-                return None
-
-            cipher = AES.new(self.aes_key, AES.MODE_CBC, self.aes_iv)
-            decrypted_padded = cipher.decrypt(encrypted_data)
-            decrypted_bytes = unpad(decrypted_padded, 16)
-            
-            return decrypted_bytes
-
-        except Exception as e:
-            print(f"Decryption error: {e}")
+        encrypted_data = b64decode_lenient(encrypted_base64)
+        if encrypted_data is None:
+            print("Base64 decode failed")
             return None
-
-    def send_battery_to_unity(self, voltage, percentage):
-        if self.unity_socket:
-            try:
-                encrypted_battery = self.encrypt_battery_data(voltage, percentage)
-                if encrypted_battery:
-                    message = encrypted_battery + '\n'
-                    self.unity_socket.sendall(message.encode('utf-8'))
-                    print(f"Sent encrypted battery data to Unity: {voltage}V, {percentage}%")
-            except Exception as e:
-                print(f"Failed to send battery data to Unity: {e}")
-                try:
-                    self.unity_socket.close()
-                except:
-                    pass
-                self.unity_socket = None
-                # Try to reconnect to Unity
-                self.connect_to_unity()
+        return self.decrypt_bytes(encrypted_data)
+
+    def decrypt_bytes(self, encrypted_data):
+        """Decrypt raw AES-CBC ciphertext (PKCS7 padded)."""
+        decrypted = self.codec.decrypt(encrypted_data)
+        if decrypted is None:
+            print(f"Decryption failed ({len(encrypted_data)} bytes)")
+        return decrypted
+
+    def send_battery_to_unity(self, reading):
+        """Called from the telemetry channel; only hands the message to the Unity dispatcher"""
+        voltage, percentage = reading
+        encrypted_battery = self.encrypt_battery_data(voltage, percentage)
+        if encrypted_battery and self.unity_dispatcher:
+            self.unity_dispatcher.submit((encrypted_battery + '\n').encode('utf-8'),
+                                         f"encrypted battery data {voltage}V, {percentage}%")
+
+    def _battery_changed(self, last, new):
+        return (abs(new[0] - last[0]) >= self.BATTERY_VOLT_DELTA
+                or abs(new[1] - last[1]) >= self.BATTERY_PCT_DELTA)
 
     #XOR Encryption for Movement Commands
     def xor_encrypt(self, plaintext):
@@ -169,7 +467,7 @@ class FireBeetleMQTTPublisher:
     def on_mqtt_connect(self, client, userdata, flags, rc):
         if rc == 0:
             print("MQTT connection successful")
-            client.subscribe(self.topic_ultra96_to_sensor, qos=1)
+            client.subscribe(self.topic_ultra96_to_sensor, qos=self.QOS[self.topic_ultra96_to_sensor])
             print(f"Subscribed to topic: {self.topic_ultra96_to_sensor}")
         else:
             print(f"MQTT connection failed (code {rc})")
@@ -184,6 +482,7 @@ class FireBeetleMQTTPublisher:
             print(f"Received from MQTT ({msg.topic}): {payload}")
 
             # Try to parse JSON
+            data = None
             try:
                 data = json.loads(payload)
                 if "prediction" in data:
@@ -200,37 +499,12 @@ class FireBeetleMQTTPublisher:
                     return
 
             plaintext = str(number) + '\n'
-            
             encrypted_command = self.xor_encrypt(plaintext)
-            
-            encrypted_command_with_newline = encrypted_command + b'\n'
-
-            to_remove = []
-            with self.command_lock:
-                for ip, sock in list(self.command_sockets.items()):
-                    try:
-                        if sock:
-                            sock.sendall(encrypted_command_with_newline)
-                            print(f"Sent XOR-encrypted movement '{number}' to FireBeetle {ip}:{self.FIREBEETLE_CMD_PORT}")
-                            print(f"   Encrypted hex: {encrypted_command.hex()}")
-                        else:
-                            raise Exception("socket is None")
-                    except Exception as e:
-                        print(f"Failed to send encrypted command to {ip}: {e}")
-                        to_remove.append(ip)
-
-                # Attempt reconnects for failed sockets
-                for ip in to_remove:
-                    try:
-                        old = self.command_sockets.pop(ip, None)
-                        if old:
-                            try:
-                                old.close()
-                            except:
-                                pass
-                        self._connect_command_socket(ip)
-                    except Exception as e:
-                        print(f"Reconnect attempt to {ip} failed: {e}")
+            trace = data.get("trace") if isinstance(data, dict) else None
+
+            # Hand off to each robot's dispatcher (see CommandDispatcher)
+            for dispatcher in self.command_dispatchers.values():
+                dispatcher.submit(encrypted_command + b'\n', f"XOR-encrypted movement '{number}'", trace)
 
         except Exception as e:
             print(f"Error handling MQTT message: {e}")
@@ -240,53 +514,199 @@ class FireBeetleMQTTPublisher:
         """Handle AES-encrypted IMU data from FireBeetle"""
         print(f"New TCP connection from {addr}")
         self.tcp_clients.add(client_socket)
-        buffer = b""
+        framer = None
 
         try:
             while True:
                 data = client_socket.recv(2048)
                 if not data:
                     break
+                t_ingress = time.monotonic_ns()
 
-                buffer += data
-                while b'\n' in buffer:
-                    message_b, buffer = buffer.split(b'\n', 1)
-                    encrypted_b64 = message_b.decode('utf-8').strip()
-                    if not encrypted_b64:
-                        continue
+                if framer is None:
+                    framer, process = self.detect_protocol(data, addr)
+                messages = framer.feed(data)
+                if messages:
+                    process(messages, addr, t_ingress)
 
-                    print(f"Received AES-encrypted IMU data ({len(encrypted_b64)} chars): {encrypted_b64[:60]}...")
+        except Exception as e:
+            print(f"TCP client error {addr}: {e}")
+        finally:
+            client_socket.close()
+            self.tcp_clients.discard(client_socket)
+            if self.coalescer:
+                self.coalescer.flush(addr)
+            print(f"TCP connection closed: {addr}")
 
-                    # Decrypt the IMU data using your robust function
-                    decrypted_bytes = self.decrypt_data(encrypted_b64)
-                    
-                    if decrypted_bytes:
-                        decrypted_message = decrypted_bytes.decode('utf-8', errors='ignore')
-                        print(f"Successfully decrypted IMU data: {decrypted_message[:80]}...")
+    def process_batch(self, messages, addr, t_ingress):
+        """Decrypt and parse every complete line from one read, forward them as one MQTT message"""
+        # Decrypt pass: one batched CBC call for every line of the read
+        lines = [m for m in messages if m.strip()]
+        texts = []
+        failed = 0
+        for decrypted_bytes in self.codec.decrypt_b64_many(lines):
+            if decrypted_bytes:
+                texts.append(decrypted_bytes.decode('utf-8', errors='ignore'))
+            else:
+                failed += 1
 
-                        # Parse data and separate IMU and battery
-                        imu_sets, battery_data = self.parse_sensor_data(decrypted_message)
+        # Parse pass; sets are not carried across lines
+        imu_sets = []
+        battery_data = None
+        for text in texts:
+            sets, battery = self.parse_sensor_data(text)
+            imu_sets.extend(sets)
+            if battery:
+                battery_data = battery
+
+        imu_bytes = self.pack_imu_data(imu_sets) if imu_sets else b''
+        self._forward_batch(addr, t_ingress, imu_bytes, len(imu_sets), battery_data,
+                            len(texts) + failed, failed, texts[-1] if texts else None)
+
+    def detect_protocol(self, first_data, addr):
+        """Pick (framer, batch handler) for a connection from its first bytes"""
+        if first_data[:1] == V2_MAGIC[:1]:
+            print(f"Glove {addr} speaks binary protocol v2")
+            return BinaryFramer(), self.process_v2_batch
+        return LineFramer(), self.process_batch
+
+    def process_v2_batch(self, frames, addr, t_ingress):
+        """Decrypt protocol v2 frames from one read and forward them as one MQTT message"""
+        chunks = []
+        n_sets = 0
+        failed = 0
+        battery_data = None
+        sample = None
+        for plaintext in self.codec.decrypt_many(frames):
+            if not plaintext or len(plaintext) < V2_PAYLOAD_HEADER.size:
+                failed += 1
+                continue
+            fmt, sets, millivolts, percentage = V2_PAYLOAD_HEADER.unpack_from(plaintext)
+            body = plaintext[V2_PAYLOAD_HEADER.size:]
+            if fmt == V2_FORMAT_FLOAT32 and len(body) == sets * IMU_SET_STRUCT.size:
+                chunks.append(body)
+            elif fmt == V2_FORMAT_INT16 and len(body) == sets * IMU_SET_INT16_STRUCT.size:
+                chunks.append(self.int16_sets_to_float32(body))
+            else:
+                failed += 1
+                continue
+            n_sets += sets
+            if millivolts:
+                battery_data = {'voltage': millivolts / 1000.0, 'percentage': float(percentage)}
+            sample = f"v2 format={fmt} sets={sets} battery={millivolts}mV,{percentage}%"
+
+        self._forward_batch(addr, t_ingress, b''.join(chunks), n_sets, battery_data,
+                            len(frames), failed, sample)
+
+    @staticmethod
+    def int16_sets_to_float32(body):
+        """Raw int16 MPU6050 counts -> the float32 g / deg/s layout published to MQTT"""
+        return b''.join(
+            IMU_SET_STRUCT.pack(*[v / INT16_SCALES[i % 6] for i, v in enumerate(counts)])
+            for counts in IMU_SET_INT16_STRUCT.iter_unpack(body)
+        )
 
-                        # Send encrypted battery data to Unity
-                        if battery_data:
-                            self.send_battery_to_unity(battery_data['voltage'], battery_data['percentage'])
+    def _forward_batch(self, addr, t_ingress, imu_bytes, n_sets, battery_data, messages, failed, sample):
+        # Newest battery reading of the batch; never blocks IMU forwarding
+        if battery_data:
+            self.battery.update((battery_data['voltage'], battery_data['percentage']))
 
-                        # Pack IMU data and send to MQTT
-                        if imu_sets:
-                            all_bytes = self.pack_imu_data(imu_sets)
-                            self.publish_binary_to_mqtt(all_bytes)
-                            print(f"Published {len(all_bytes)} bytes to Ultra96 "
-                                  f"({len(imu_sets)} sets, {len(imu_sets)*5} IMUs)")
-                    else:
-                        print(f"Failed to decrypt IMU data from {addr}")
+        if imu_bytes:
+            if self.coalescer:
+                self.coalescer.add(addr, imu_bytes, t_ingress)
+            else:
+                self._publish_packet(imu_bytes, t_ingress)
+
+        self._record_ingest(addr, messages, failed, n_sets, sample)
+
+    def _publish_packet(self, imu_bytes, t_ingress):
+        if self.trace_recorder:
+            imu_bytes += pack_trace(next(self._trace_seq), t_ingress)
+        published = self.publish_binary_to_mqtt(imu_bytes)
+        with self.stats_lock:
+            self.stats["publishes" if published else "unpublished"] += 1
+            self.stats["bytes"] += len(imu_bytes)
+
+    @staticmethod
+    def _empty_stats():
+        return {"messages": 0, "decrypt_failed": 0, "sets": 0, "publishes": 0,
+                "unpublished": 0, "bytes": 0, "gloves": set(), "sample": None}
+
+    def _record_ingest(self, addr, messages, failed, sets, sample):
+        with self.stats_lock:
+            st = self.stats
+            st["messages"] += messages
+            st["decrypt_failed"] += failed
+            st["sets"] += sets
+            st["gloves"].add(addr)
+            if sample is not None:
+                st["sample"] = sample
+
+            now = time.monotonic()
+            dt = now - self._last_report
+            if dt < self.REPORT_INTERVAL_S:
+                return
+            self.stats = self._empty_stats()
+            self._last_report = now
+
+        print(f"[INGEST] {dt:.1f}s from {len(st['gloves'])} glove(s): {st['messages']} messages "
+              f"({st['messages'] / dt:.1f}/s, {st['decrypt_failed']} undecryptable), "
+              f"{st['sets']} sets in {st['publishes']} publishes ({st['bytes']} bytes), "
+              f"{st['unpublished']} not published (MQTT down)")
+        crypto = self.codec.report(reset=True)
+        if crypto["messages"]:
+            print(f"[INGEST] decrypt: {crypto['messages_per_s']:.0f} msg/s, {crypto['mb_per_s']:.1f} MB/s "
+                  f"per busy worker-second")
+        dispatchers = list(self.command_dispatchers.items())
+        if self.unity_dispatcher:
+            dispatchers.append(("Unity battery", self.unity_dispatcher))
+        for ip, dispatcher in dispatchers:
+            r = dispatcher.report()
+            print(f"[CMD] {ip}: {'up' if r['connected'] else 'DOWN'} sent={r['sent']} replaced={r['replaced']} "
+                  f"stale={r['stale']} failed={r['failed']} connects={r['connects']} "
+                  f"send_ms p50={r['send_ms_p50']:.2f} p99={r['send_ms_p99']:.2f} max={r['send_ms_max']:.2f}")
+        if st["sample"]:
+            print(f"[INGEST] sample: {st['sample'][:80]}...")
+
+    # IMU, asyncio mode: all gloves on one event loop, decrypt/parse on a small pool
+    async def handle_async_client(self, reader, writer):
+        """Handle one FireBeetle connection on the event loop"""
+        addr = writer.get_extra_info("peername")
+        print(f"New TCP connection from {addr}")
+        self.tcp_clients.add(writer)
+        loop = asyncio.get_running_loop()
+        framer = None
+
+        try:
+            while True:
+                data = await reader.read(2048)
+                if not data:
+                    break
+                t_ingress = time.monotonic_ns()
+
+                if framer is None:
+                    framer, process = self.detect_protocol(data, addr)
+                messages = framer.feed(data)
+                if messages:
+                    # Awaited before the next read, so this glove's frames stay in order
+                    await loop.run_in_executor(self.ingest_pool, process, messages, addr, t_ingress)
 
         except Exception as e:
             print(f"TCP client error {addr}: {e}")
         finally:
-            client_socket.close()
-            self.tcp_clients.discard(client_socket)
+            writer.close()
+            self.tcp_clients.discard(writer)
+            if self.coalescer:
+                self.coalescer.flush(addr)
             print(f"TCP connection closed: {addr}")
 
+    async def _serve_async(self):
+        server = await asyncio.start_server(self.handle_async_client, self.TCP_IP, self.TCP_PORT,
+                                            reuse_address=True)
+        print(f"TCP server (asyncio) listening on {self.TCP_IP}:{self.TCP_PORT}")
+        async with server:
+            await server.serve_forever()
+
     def parse_sensor_data(self, text):
         """Parse sensor data string"""
         imu_sets = []
@@ -320,13 +740,11 @@ class FireBeetleMQTTPublisher:
 
     def pack_imu_data(self, imu_sets):
         """Pack IMU data into binary format for MQTT"""
-        all_bytes = b''
-        for imu_set in imu_sets:
-            for imu_label in ["IMU0", "IMU1", "IMU2", "IMU3", "IMU4"]:
-                imu_list = imu_set.get(imu_label, [0.0]*6)
-                imu_list = [float(v) for v in imu_list]
-                all_bytes += struct.pack('!6f', *imu_list)
-        return all_bytes
+        zeros = [0.0] * 6
+        return b''.join(
+            IMU_SET_STRUCT.pack(*[float(v) for label in IMU_LABELS for v in imu_set.get(label, zeros)])
+            for imu_set in imu_sets
+        )
 
     def publish_binary_to_mqtt(self, data_bytes):
         """Publish binary IMU data to Ultra96"""
@@ -334,11 +752,10 @@ class FireBeetleMQTTPublisher:
             self.mqtt_client.publish(
                 self.topic_sensor_to_ultra96,
                 payload=data_bytes,
-                qos=1
+                qos=self.QOS[self.topic_sensor_to_ultra96]
             )
-            print(f"Published {len(data_bytes)} binary bytes to {self.topic_sensor_to_ultra96}")
-        else:
-            print("MQTT not connected, cannot publish")
+            return True
+        return False
 
     def start_tcp_server(self):
         """Start TCP server to receive FireBeetle data"""
@@ -357,47 +774,77 @@ class FireBeetleMQTTPublisher:
         except KeyboardInterrupt:
             print("TCP server shutting down...")
         finally:
-            if self.unity_socket:
-                self.unity_socket.close()
             tcp_socket.close()
-            if self.mqtt_client:
-                self.mqtt_client.loop_stop()
-                self.mqtt_client.disconnect()
+            self.shutdown()
 
-    def _connect_command_socket(self, ip):
-        """Connect to FireBeetle command server"""
+    def start_async_tcp_server(self, workers=2):
+        """Start asyncio TCP server: one event loop for every FireBeetle connection"""
+        self.ingest_pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ingest")
         try:
-            s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            s.settimeout(5)
-            s.connect((ip, self.FIREBEETLE_CMD_PORT))
-            s.settimeout(None)
-            with self.command_lock:
-                self.command_sockets[ip] = s
-            print(f"Connected to FireBeetle command server at {ip}:{self.FIREBEETLE_CMD_PORT}")
-            return True
-        except Exception as e:
-            print(f"Could not connect to {ip}:{self.FIREBEETLE_CMD_PORT} - {e}")
-            with self.command_lock:
-                self.command_sockets[ip] = None
-            return False
-
-    def connect_command_sockets(self):
-        """Connect to all configured FireBeetle command servers"""
+            asyncio.run(self._serve_async())
+        except KeyboardInterrupt:
+            print("TCP server shutting down...")
+        finally:
+            self.ingest_pool.shutdown(wait=False)
+            self.shutdown()
+
+    def shutdown(self):
+        for dispatcher in self.command_dispatchers.values():
+            dispatcher.close()
+        if self.unity_dispatcher:
+            self.unity_dispatcher.close()
+        if self.mqtt_client:
+            self.mqtt_client.loop_stop()
+            self.mqtt_client.disconnect()
+
+    def start_command_dispatchers(self):
+        """One background dispatcher per configured FireBeetle command server"""
         for ip in self.FIREBEETLE_CMD_IPS:
-            self._connect_command_socket(ip)
+            self.command_dispatchers[ip] = CommandDispatcher(ip, self.FIREBEETLE_CMD_PORT,
+                                                             trace_recorder=self.trace_recorder)
 
-    def start(self):
+    def start(self, ingest="threads", workers=2):
         """Start MQTT + TCP components"""
         print("Starting FireBeetle MQTT Publisher & TCP Bridge...")
-        self.connect_command_sockets()
+        self.connect_to_unity()
+        self.start_command_dispatchers()
 
         if not self.setup_mqtt():
             print("MQTT setup failed. Exiting...")
             return
 
-        self.start_tcp_server()
+        if ingest == "async":
+            self.start_async_tcp_server(workers)
+        else:
+            self.start_tcp_server()
 
 if __name__ == "__main__":
-    publisher = FireBeetleMQTTPublisher()
-
-    publisher.start()
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--trace-log", default=None,
+                    help="stamp sensor packets with a latency trace and log command egress here "
+                         "(summarise with latency_trace.py)")
+    ap.add_argument("--ingest", choices=["threads", "async"], default="threads",
+                    help="threads: one thread per glove connection; async: one event loop for all gloves")
+    ap.add_argument("--ingest-workers", type=int, default=2,
+                    help="decrypt/parse worker threads in async mode")
+    ap.add_argument("--cmd-ips", nargs="+", default=None,
+                    help="FireBeetle command servers (one background dispatcher each)")
+    ap.add_argument("--coalesce-frames", type=int, default=0,
+                    help="publish IMU frames in packets of this many frames (default: one packet per TCP read)")
+    ap.add_argument("--coalesce-ms", type=float, default=None,
+                    help="max time a frame waits for its packet to fill (default 40 ms when coalescing)")
+    ap.add_argument("--battery-interval", type=float, default=5.0,
+                    help="seconds between battery updates to Unity when the reading has not changed")
+    ap.add_argument("--qos-sensor", type=int, choices=[0, 1, 2], default=1,
+                    help="QoS for IMU packets to the Ultra96")
+    ap.add_argument("--qos-commands", type=int, choices=[0, 1, 2], default=1,
+                    help="QoS for the prediction/command subscription")
+    args = ap.parse_args()
+
+    publisher = FireBeetleMQTTPublisher(trace_log=args.trace_log, coalesce_frames=args.coalesce_frames,
+                                        coalesce_ms=args.coalesce_ms, qos_sensor=args.qos_sensor,
+                                        qos_commands=args.qos_commands, battery_interval_s=args.battery_interval)
+    if args.cmd_ips:
+        publisher.FIREBEETLE_CMD_IPS = args.cmd_ips
+
+    publisher.start(ingest=args.ingest, workers=args.ingest_workers)
@@ -3,9 +3,12 @@ import ssl
 import json
 import time
 import socket
-from Crypto.Cipher import AES
-from threading import Thread, Lock
-import queue
+import asyncio
+from collections import deque
+from threading import Thread, Event
+import argparse
+from aes_codec import AesCbcCodec
+from latency_trace import TraceRecorder, _percentiles
 
 # -------------------------------
 # MQTT Broker (WSL Mosquitto)
@@ -29,93 +32,181 @@ FIREBEETLE_PORT = 5000
 UNITY_IP = "172.20.10.3"
 UNITY_PORT = 6000
 
+# Latency trace log (set with --trace-log)
+trace_recorder = None
+
 AES_KEY = b"1234567890abcdef"
 XOR_KEY = bytes([0x55, 0xAA, 0x33, 0xCC, 0x0F, 0xF0, 0x99, 0x66,
                  0x12, 0x34, 0x56, 0x78, 0xAB, 0xCD, 0xEF, 0x01])
 
-class TCPManager:
-    def __init__(self, target_ip, target_port, name):
-        self.target_ip = target_ip
-        self.target_port = target_port
+unity_codec = AesCbcCodec(AES_KEY, b'\x00' * 16)
+unity_ciphertexts = {}
+
+class OutputTarget:
+    """One outbound TCP destination with a latest-value-wins slot"""
+    def __init__(self, name, host, port, encode):
         self.name = name
-        self.socket = None
-        self.lock = Lock()
-        self.send_queue = queue.Queue()
-        self.connected = False
-        self.thread = None
-        self.running = True
-        
+        self.host = host
+        self.port = port
+        self.encode = encode
+        self.slot = None  # (payload, enqueued_ns, trace); newer commands overwrite it
+        self.wake = None
+        self.writer = None
+
+        self.sent = 0
+        self.replaced = 0
+        self.stale = 0
+        self.failed = 0
+        self.connects = 0
+        self.last_payload = b''
+        self.latencies_ms = deque(maxlen=1024)
+
+    def report(self):
+        lat = _percentiles(self.latencies_ms)
+        return (f"{self.name} {self.host}:{self.port}: {'up' if self.writer else 'DOWN'} sent={self.sent} "
+                f"replaced={self.replaced} stale={self.stale} failed={self.failed} connects={self.connects} "
+                f"send_ms p50={lat.get('p50', 0.0):.2f} p99={lat.get('p99', 0.0):.2f} max={lat.get('max', 0.0):.2f} "
+                f"last={self.last_payload.hex() or '-'}")
+
+
+class OutputBridge:
+    """All outbound targets on one asyncio loop (own thread).
+
+    A submitted prediction is encoded once per target and written as soon as
+    the target is connected; there is no polling interval. Disconnects are
+    detected by a reader task, and reconnects back off exponentially without
+    delaying the other targets."""
+    def __init__(self, stale_s=2.0, connect_timeout=5.0, backoff_min=0.5, backoff_max=10.0):
+        self.targets = []
+        self.stale_ns = int(stale_s * 1e9)
+        self.connect_timeout = connect_timeout
+        self.backoff_min = backoff_min
+        self.backoff_max = backoff_max
+        self.loop = None
+        self._thread = None
+
+    def add_target(self, name, host, port, encode):
+        self.targets.append(OutputTarget(name, host, port, encode))
+
     def start(self):
-        self.thread = Thread(target=self._connection_worker, daemon=True)
-        self.thread.start()
-        
+        self.loop = asyncio.new_event_loop()
+        ready = Event()
+        self._thread = Thread(target=self._run_loop, args=(ready,), daemon=True)
+        self._thread.start()
+        ready.wait()
+
     def stop(self):
-        self.running = False
-        if self.socket:
-            self.socket.close()
-            
-    def send(self, data):
-        self.send_queue.put(data)
-        
-    def _connection_worker(self):
-        while self.running:
-            try:
-                # Create new socket connection
-                with self.lock:
-                    if self.socket:
-                        self.socket.close()
-                    self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                    self.socket.settimeout(5.0)
-                    self.socket.connect((self.target_ip, self.target_port))
-                    self.connected = True
-                    print(f"Connected to {self.name}")
-                
-                # Process messages while connected
-                while self.connected and self.running:
-                    try:
-                        # Wait for message with timeout
-                        data = self.send_queue.get(timeout=1.0)
-                        self._send_data(data)
-                    except queue.Empty:
-                        try:
-                            self.socket.settimeout(0.1)
-                            self.socket.recv(1, socket.MSG_PEEK)
-                        except (socket.timeout, BlockingIOError):
-                            continue
-                        except:
-                            self.connected = False
-                            break
-                            
-            except Exception as e:
-                print(f"{self.name} connection failed: {e}")
-                self.connected = False
-                time.sleep(2)  # Wait before retry
-                
-    def _send_data(self, data):
+        if self.loop:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self._thread.join(timeout=2.0)
+
+    def submit(self, movement_class, trace=None):
+        """Thread-safe; called from the MQTT thread"""
+        now = time.monotonic_ns()
+        items = [(t, (t.encode(movement_class), now, trace)) for t in self.targets]
+        self.loop.call_soon_threadsafe(self._fill_slots, items)
+
+    def _fill_slots(self, items):
+        for target, item in items:
+            if target.slot is not None:
+                target.replaced += 1
+            target.slot = item
+            target.wake.set()
+
+    def _run_loop(self, ready):
+        asyncio.set_event_loop(self.loop)
+        for target in self.targets:
+            target.wake = asyncio.Event()
+            self.loop.create_task(self._serve(target))
+        self.loop.call_soon(ready.set)
+        self.loop.run_forever()
+
+    async def _connect(self, target):
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(target.host, target.port), timeout=self.connect_timeout)
+        writer.get_extra_info("socket").setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        target.writer = writer
+        target.connects += 1
+        print(f"Connected to {target.name}")
+        self.loop.create_task(self._watch(target, reader, writer))
+
+    async def _watch(self, target, reader, writer):
+        # Drains ACKs and notices the peer closing, instead of polling with MSG_PEEK
         try:
-            with self.lock:
-                if self.socket and self.connected:
-                    self.socket.sendall(data)
-                    print(f"Sent to {self.name}: {data}")
-        except Exception as e:
-            print(f"{self.name} send error: {e}")
-            self.connected = False
-
-# Initialize TCP managers
-firebeetle_manager = TCPManager(FIREBEETLE_IP, FIREBEETLE_PORT, "FireBeetle")
-unity_manager = TCPManager(UNITY_IP, UNITY_PORT, "Unity")
-
-# Message processing
-def send_to_firebeetle(movement_class: int):
-    plaintext = str(movement_class).encode('utf-8').ljust(16, b'\x00')
-    encrypted = bytes([plaintext[i] ^ XOR_KEY[i] for i in range(16)])
-    firebeetle_manager.send(encrypted)
+            while await reader.read(1024):
+                pass
+        except OSError:
+            pass
+        if target.writer is writer:
+            print(f"{target.name} disconnected")
+            self._drop(target)
+            target.wake.set()
+
+    def _drop(self, target):
+        if target.writer:
+            target.writer.close()
+        target.writer = None
+
+    async def _serve(self, target):
+        backoff = self.backoff_min
+        while True:
+            if target.writer is None:
+                try:
+                    await self._connect(target)
+                    backoff = self.backoff_min
+                except (OSError, asyncio.TimeoutError) as e:
+                    print(f"{target.name} connection failed: {e} (retry in {backoff:.1f}s)")
+                    await asyncio.sleep(backoff)
+                    backoff = min(backoff * 2, self.backoff_max)
+                    continue
+
+            await target.wake.wait()
+            target.wake.clear()
+            item, target.slot = target.slot, None
+            if item is None or target.writer is None:
+                target.slot = target.slot or item
+                continue
+
+            payload, enqueued_ns, trace = item
+            if time.monotonic_ns() - enqueued_ns > self.stale_ns:
+                target.stale += 1
+                continue
+            try:
+                target.writer.write(payload)
+                await target.writer.drain()
+            except OSError as e:
+                print(f"{target.name} send error: {e}")
+                target.failed += 1
+                self._drop(target)
+                # Retry after reconnecting unless a newer command has arrived
+                target.slot = target.slot or item
+                target.wake.set()
+                continue
 
-def send_to_unity(movement_class: int):
-    cipher = AES.new(AES_KEY, AES.MODE_CBC, iv=b'\x00' * 16)
+            egress_ns = time.monotonic_ns()
+            target.sent += 1
+            target.latencies_ms.append((egress_ns - enqueued_ns) / 1e6)
+            target.last_payload = payload
+            if trace_recorder and trace:
+                trace_recorder.record(trace, egress_ns, hop=f"laptop_bridge:{target.name}")
+
+
+# Message encoding per target kind
+def encode_firebeetle(movement_class: int):
     plaintext = str(movement_class).encode('utf-8').ljust(16, b'\x00')
-    encrypted = cipher.encrypt(plaintext)
-    unity_manager.send(encrypted)
+    return bytes([plaintext[i] ^ XOR_KEY[i] for i in range(16)])
+
+def encode_unity(movement_class: int):
+    # Fixed key/IV and one block per class, so each ciphertext is computed once
+    encrypted = unity_ciphertexts.get(movement_class)
+    if encrypted is None:
+        plaintext = str(movement_class).encode('utf-8').ljust(16, b'\x00')
+        encrypted = unity_ciphertexts[movement_class] = unity_codec.encrypt(plaintext, pad=False)
+    return encrypted
+
+ENCODERS = {"firebeetle": encode_firebeetle, "unity": encode_unity}
+
+bridge = OutputBridge()
 
 # -------------------------------
 # MQTT Setup
@@ -139,10 +230,7 @@ def on_message(c, userdata, msg):
         if movement_class is not None:
             movement_class = int(movement_class)
             print(f"\nMovement class from MQTT: {movement_class}")
-            
-            # Non-blocking sends
-            send_to_firebeetle(movement_class)
-            send_to_unity(movement_class)
+            bridge.submit(movement_class, payload_json.get("trace"))
         else:
             print("No 'prediction' in payload")
     except json.JSONDecodeError as e:
@@ -154,32 +242,48 @@ def on_disconnect(c, userdata, rc):
     print(f"Disconnected from WSL broker: {rc}")
 
 def main():
+    global trace_recorder
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--trace-log", default=None, help="log latency traces of predictions (see latency_trace.py)")
+    ap.add_argument("--target", action="append", default=None, metavar="KIND:HOST:PORT",
+                    help="output target, KIND is firebeetle or unity; repeat for more robots/displays "
+                         "(default: the FireBeetle and Unity addresses above)")
+    args = ap.parse_args()
+    if args.trace_log:
+        trace_recorder = TraceRecorder(args.trace_log, "laptop_bridge")
+
+    targets = args.target or [f"firebeetle:{FIREBEETLE_IP}:{FIREBEETLE_PORT}", f"unity:{UNITY_IP}:{UNITY_PORT}"]
+    for spec in targets:
+        kind, host, port = spec.split(":")
+        name = ("FireBeetle" if kind == "firebeetle" else "Unity") if not args.target else f"{kind}@{host}:{port}"
+        bridge.add_target(name, host, int(port), ENCODERS[kind])
+
     client.on_connect = on_connect
     client.on_message = on_message
     client.on_disconnect = on_disconnect
 
     print("Laptop bridge starting...")
     
-    # Start TCP managers
-    firebeetle_manager.start()
-    unity_manager.start()
+    # Start the output loop (connects to every target in the background)
+    bridge.start()
 
     try:
         client.connect(BROKER_IP, BROKER_PORT, keepalive=60)
         client.loop_start()
         print("Bridge running. Press Ctrl+C to exit.")
 
-        # Main loop just sleeps - no blocking operations
+        # Main loop only reports per-target send stats
         while True:
-            time.sleep(1)
+            time.sleep(10)
+            for target in bridge.targets:
+                print("[OUT]", target.report())
 
     except KeyboardInterrupt:
         print("\nStopping bridge...")
     finally:
         client.loop_stop()
         client.disconnect()
-        firebeetle_manager.stop()
-        unity_manager.stop()
+        bridge.stop()
         print("Bridge stopped")
 
 if __name__ == "__main__":